@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = """
+---
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+httpapi: dss
+short_description: HttpApi Plugin for Dataiku Data Science Studio
+description:
+    - This HttpApi plugin keeps one authenticated connection to the DSS public API open for all the tasks
+      of a play. The dss_* modules then run on the controller and send their HTTP requests through it
+      instead of being uploaded to and executed on the target.
+    - The DSS host and port are the ones of the connection (ansible_host, ansible_httpapi_port,
+      ansible_httpapi_use_ssl). If ansible_httpapi_password is set, it is used as the API Key, otherwise
+      the API Key given to the modules (api_key, connect_to or DATAIKU_ANSIBLE_DSS_API_KEY) is used.
+version_added: "2.9"
+"""
+
+import base64
+import json
+
+from ansible.module_utils._text import to_bytes, to_text
+from ansible.plugins.httpapi import HttpApiBase
+
+BASE_PATH = "/dip/publicapi"
+
+
+class HttpApi(HttpApiBase):
+    def login(self, username, password):
+        # DSS API Keys are sent as the user of a basic authentication with an empty password
+        if password:
+            token = base64.b64encode(to_bytes("{}:".format(password)))
+            self.connection._auth = {"Authorization": "Basic {}".format(to_text(token))}
+
+    def logout(self):
+        self.connection._auth = None
+
+    def send_request(self, method, path, body=None, headers=None):
+        # The body is base64 encoded to go through the JSON-RPC of the persistent connection
+        data = base64.b64decode(body) if body is not None else None
+        if not path.startswith(BASE_PATH):
+            path = BASE_PATH + path
+        response, response_data = self.connection.send(path, data, method=method, headers=headers or {})
+        return {
+            "status": response.getcode(),
+            "reason": getattr(response, "msg", ""),
+            "headers": dict(response.info().items()),
+            "body": to_text(base64.b64encode(response_data.getvalue())),
+        }
+
+    def handle_httperror(self, exc):
+        # Give the error response back to the module, where the DSS client turns it into a DataikuException
+        return exc
@@ -3,7 +3,6 @@
 from __future__ import absolute_import
 
 import collections
-import copy
 import re
 import time
 import traceback
@@ -158,7 +157,8 @@ def run_module():
             else:
                 infra = api_deployer.get_infra(args.id)
             infra_settings = infra.get_settings()
-            previous_settings = copy.deepcopy(infra_settings.get_raw())
+            # The changes below replace top level values, a shallow copy keeps the previous ones
+            previous_settings = dict(infra_settings.get_raw())
 
             # Remove all / push all
             infra_settings.get_raw()["permissions"] = args.permissions
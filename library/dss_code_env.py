@@ -3,7 +3,6 @@
 from __future__ import absolute_import
 
 import collections
-import copy
 import re
 import time
 import traceback
@@ -13,9 +12,23 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.dataiku_utils import (
     MakeNamespace,
     add_dss_connection_args,
+    build_code_env_definition,
+    code_env_packages_changed,
     extract_keys,
     get_client_from_parsed_args,
-    update,
+    get_code_env_path,
+    get_code_env_pinned_spec,
+    get_code_env_spec_fingerprint,
+    get_code_env_state_key,
+    get_code_env_update_reason,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    import_code_env_artifact_if_matching,
+    merge,
+    parse_code_env_update,
+    read_code_env_lockfile,
+    update_code_env_packages,
+    write_code_env_lockfile,
 )
 from ansible.module_utils.dataikuapi.utils import DataikuException
 
@@ -77,12 +90,59 @@ options:
         required: False
     update:
         description:
-            - Update packages to match spec if the code env def changed. Default true.
+            - Update packages to match spec. Either true (at every run), false (only at creation or if the package list
+              or jupyter support changed) or "auto". Default true.
+            - With "auto", a fingerprint of the spec applied at the last build (packages, conda environment, python
+              interpreter, core packages and jupyter support flags, version) is stored on the machine running the module,
+              in the state directory (see the README), and the packages are updated only if it differs.
         required: false
     state:
         description:
             - Is the code env supposed to be there or not. Either "present" or "absent". Default "present"
         required: false
+    artifact:
+        description:
+            - Path of a tarball made by dss_code_env_export on the machine running the module. When the packages must
+              be updated, the code env directory is replaced by the content of the artifact if it was built from the
+              same spec at the same path, update_packages() is used otherwise. The module must then run as the owner
+              of the datadir.
+        required: false
+    datadir:
+        description:
+            - The datadir of DSS, used to find the code env directory when importing an artifact.
+        required: false
+    env_path:
+        description:
+            - The directory of the code env when importing an artifact, by default "code-envs/{python|R}/{name}"
+              in the datadir, followed by "versions/{version}" if a version is set.
+        required: false
+    package_source:
+        description:
+            - Python only. A wheelhouse directory on the DSS node, or the URL of a local package index, from which the
+              packages of package_list are installed instead of PyPI. It is added as pip options to the package list.
+              See dss_code_env_wheelhouse to fill a wheelhouse.
+        required: false
+    build_timeout:
+        description:
+            - Maximum time in seconds of the update of the packages. When it expires, the running jobs of the code
+              env are aborted and the task fails. No limit by default.
+        required: false
+    build_log:
+        description:
+            - File on the machine running the module where the logs of the update of the packages are copied while
+              it runs.
+        required: false
+    log_poll_interval:
+        description:
+            - Interval in seconds between two reads of the logs during the update of the packages.
+        required: false
+        default: 2
+    lockfile:
+        description:
+            - Path of a JSON file on the machine running the module. After a build from a spec not found in it, the exact
+              packages installed by DSS are written in it and pinned in the code env. The following runs with the same
+              spec, on any node given the same file, use the pinned packages instead of resolving the spec again.
+        required: false
 author:
     - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
 """
@@ -113,6 +173,57 @@ EXAMPLES = """
     - jinja2>=2.10,<2.11
     - flask>=1.0,<1.1
 
+- name: Rebuild the code env only if its spec changed since the last build
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: basic-machine-learning
+    lang: PYTHON
+    update: auto
+    package_list:
+    - scikit-learn>=0.20,<0.21
+    - scipy>=1.1,<1.2
+
+- name: Reuse the code env built on another automation node
+  become: true
+  become_user: dataiku
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: basic-machine-learning
+    lang: PYTHON
+    version: "2"
+    update: auto
+    datadir: /home/dataiku/dss
+    artifact: /tmp/basic-machine-learning-2.tar.gz
+
+- name: Build from pinned packages, shared by all the nodes through the lockfile
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: basic-machine-learning
+    lang: PYTHON
+    update: auto
+    lockfile: /home/dataiku/basic-machine-learning.lock.json
+    package_list:
+    - scikit-learn>=0.20,<0.21
+    - scipy>=1.1,<1.2
+
+- name: Install the packages from a wheelhouse on the node
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: basic-machine-learning
+    lang: PYTHON
+    package_source: /data/wheelhouse
+    package_list:
+    - scikit-learn>=0.20,<0.21
+    - scipy>=1.1,<1.2
+
+- name: Fail if the build takes more than 30 minutes, keeping its logs
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: basic-machine-learning
+    lang: PYTHON
+    build_timeout: 1800
+    build_log: /var/log/dss-code-envs/basic-machine-learning.log
+
 - name: Add some permissions
   dss_code_env:
     connect_to: "{{dss_connection_info}}"
@@ -132,6 +243,28 @@ dss_code_env:
 message:@
     description: CREATED, DELETED, MODIFIED or UNCHANGED
     type: str
+update_packages:
+    description: Whether the packages were updated (or would be in check mode)
+    type: bool
+update_reason:
+    description: Why the packages were updated or not
+    type: str
+spec_fingerprint:
+    description: The fingerprint of the spec of the code env, as stored with update set to "auto"
+    type: str
+build_timings:
+    description: Time in seconds spent in the "resolve", "download" and "install" phases of the update of the
+        packages, as seen from the logs, and in "jupyter" support, with "total" for the update
+    type: dict
+lockfile_used:
+    description: Whether the packages pinned in the lockfile were used instead of the spec
+    type: bool
+lockfile_written:
+    description: Whether the packages installed by the build were written in the lockfile
+    type: bool
+artifact_imported:
+    description: Whether the code env was imported from the artifact instead of updating its packages
+    type: bool
 """
 
 
@@ -164,7 +297,7 @@ def run_module():
         version=dict(type="str", required=False, default=None),
         core_packages=dict(type="bool", required=False, default=True),
         jupyter_support=dict(type="bool", required=False, default=True),
-        update=dict(type="bool", required=False, default=True),
+        update=dict(type="raw", required=False, default=True),
         permissions=dict(type="list", required=False, default=None),
         usable_by_all=dict(type="bool", required=False, default=None),
         owner=dict(type="str", required=False, default=None),
@@ -173,6 +306,14 @@ def run_module():
         external_conda_env_name=dict(type="str", required=False, default=None),
         python_interpreter=dict(type="str", required=False, default=None),
         desc=dict(type="dict", required=False, default=None),
+        artifact=dict(type="path", required=False, default=None),
+        datadir=dict(type="path", required=False, default=None),
+        env_path=dict(type="path", required=False, default=None),
+        lockfile=dict(type="path", required=False, default=None),
+        package_source=dict(type="str", required=False, default=None),
+        build_timeout=dict(type="float", required=False, default=None),
+        build_log=dict(type="path", required=False, default=None),
+        log_poll_interval=dict(type="float", required=False, default=2.0),
     )
     add_dss_connection_args(module_args)
 
@@ -184,6 +325,16 @@ def run_module():
         module.fail_json(
             msg="The lang attribute has invalid value '{}'. Must be either 'PYTHON' or 'R'.".format(args.lang)
         )
+    if args.package_source is not None and args.lang != "PYTHON":
+        module.fail_json(msg="The package_source attribute is only supported for PYTHON code envs")
+    if args.artifact is not None and args.datadir is None and args.env_path is None:
+        module.fail_json(msg="One of datadir or env_path is mandatory to import an artifact")
+    try:
+        args.update = parse_code_env_update(args.update)
+    except TypeError:
+        module.fail_json(
+            msg="The update attribute has invalid value '{}'. Must be either true, false or 'auto'.".format(args.update)
+        )
 
     result = dict(changed=False, message="UNCHANGED",)
 
@@ -194,42 +345,22 @@ def run_module():
 
     code_env_def = {}
     
-    required_code_env_def = {}
-    versioned_required_code_env_def = required_code_env_def
-    if args.version is not None:
-        required_code_env_def[args.version] = {"desc":{}}
-        versioned_required_code_env_def = required_code_env_def[args.version]
-    else:
-        required_code_env_def["desc"] = {}
-    if args.permissions is not None:
-        required_code_env_def["permissions"] = args.permissions
-    if args.usable_by_all is not None:
-        required_code_env_def["usableByAll"] = args.usable_by_all
-    if args.conda_environment is not None:
-        versioned_required_code_env_def["specCondaEnvironment"] = args.conda_environment
-    if args.package_list is not None:
-        versioned_required_code_env_def["specPackageList"] = "\n".join(args.package_list)
-    if args.external_conda_env_name is not None:
-        versioned_required_code_env_def["externalCondaEnvName"] = args.external_conda_env_name
-    if args.owner is not None:
-        if args.deployment_mode in ["DESIGN_MANAGED", "DESIGN_MANAGED", "PLUGIN_MANAGED", "PLUGIN_NON_MANAGED"]:
-            versioned_required_code_env_def["desc"]["owner"] = args.owner
-        else:
-            versioned_required_code_env_def["owner"] = args.owner
-    if args.desc is not None:
-        update(versioned_required_code_env_def["desc"], args.desc)
-
-    if args.core_packages and "installCorePackages" not in versioned_required_code_env_def["desc"]:
-        versioned_required_code_env_def["desc"]["installCorePackages"] = args.core_packages
-
-    if args.jupyter_support and "installJupyterSupport" not in versioned_required_code_env_def["desc"]:
-        versioned_required_code_env_def["desc"]["installJupyterSupport"] = args.jupyter_support
+    required_code_env_def, versioned_required_code_env_def = build_code_env_definition(module.params)
+
+    # Use the packages installed by a previous build of the same spec
+    if args.lockfile is not None and args.state == "present":
+        lock_fingerprint = get_code_env_spec_fingerprint(required_code_env_def, args.version)
+        lock = read_code_env_lockfile(args.lockfile)
+        result["lockfile_used"] = lock is not None and lock.get("spec_fingerprint", None) == lock_fingerprint
+        if result["lockfile_used"]:
+            versioned_required_code_env_def.update(lock["pinned_spec"])
 
     update_packages = False
 
     try:
         client = get_client_from_parsed_args(module)
-        code_envs = client.list_code_envs()
+        read_cache = get_read_cache_from_parsed_args(module)
+        code_envs = read_cache.get("code_envs", client.list_code_envs)
 
         # Check existence
         for env in code_envs:
@@ -246,22 +377,14 @@ def run_module():
             if args.deployment_mode is None:
                 args.deployment_mode = code_env_def["deploymentMode"]
             if "NON_MANAGED" not in args.deployment_mode:
-                if args.version is not None:
-                    if "specPackageList" in versioned_required_code_env_def and args.version in code_env_def and "specPackageList" in code_env_def[args.version] and versioned_required_code_env_def["specPackageList"] != code_env_def[args.version]["specPackageList"]:
-                        update_packages = True
-                    if "installJupyterSupport" in versioned_required_code_env_def["desc"] and "installJupyterSupport" in code_env_def[args.version]["desc"] and versioned_required_code_env_def["desc"]["installJupyterSupport"] != code_env_def[args.version]["desc"]["installJupyterSupport"]:
-                        update_packages = True
-                else:
-                    if "specPackageList" in required_code_env_def and "specPackageList" in code_env_def and required_code_env_def["specPackageList"] != code_env_def["specPackageList"]:
-                        update_packages = True
-                    if "installJupyterSupport" in required_code_env_def["desc"] and "installJupyterSupport" in code_env_def["desc"] and required_code_env_def["desc"]["installJupyterSupport"] != code_env_def["desc"]["installJupyterSupport"]:
-                        update_packages = True
-    
-        new_code_env_def = copy.deepcopy(code_env_def)
-        update(new_code_env_def, required_code_env_def)
+                update_packages = code_env_packages_changed(
+                    code_env_def, versioned_required_code_env_def, args.version
+                )
+
+        new_code_env_def = merge(code_env_def, required_code_env_def)
 
         # Prepare the result for dry-run mode
-        result["changed"] = create or (exists and args.state == "absent") or (args.state == "present" and new_code_env_def != code_env_def)
+        result["changed"] = create or (exists and args.state == "absent") or (args.state == "present" and new_code_env_def is not code_env_def)
         if result["changed"]:
             if create:
                 result["message"] = "CREATED"
@@ -269,11 +392,25 @@ def run_module():
                 if args.state == "absent":
                     result["message"] = "DELETED"
                 else:
-                    if code_env_def != new_code_env_def:
+                    if new_code_env_def is not code_env_def:
                         result["message"] = "MODIFIED"
                     else:
                         result["message"] = "UNMODIFIED"
 
+        state_store = get_state_store_from_parsed_args(module, "code_envs")
+        state_key = get_code_env_state_key(args.lang, args.name, args.version)
+
+        if args.state == "present":
+            result["spec_fingerprint"] = get_code_env_spec_fingerprint(new_code_env_def, args.version)
+            result["update_packages"], result["update_reason"] = get_code_env_update_reason(
+                args.update,
+                args.deployment_mode,
+                create,
+                update_packages,
+                state_store.get(state_key),
+                result["spec_fingerprint"],
+            )
+
         if module.check_mode:
             module.exit_json(**result)
 
@@ -286,17 +423,59 @@ def run_module():
                     versioned_required_code_env_def["pythonInterpreter"] = args.python_interpreter
                 code_env = client.create_code_env(args.lang, args.name, args.deployment_mode, required_code_env_def)
                 code_env_def = code_env.get_definition()
-                new_code_env_def = copy.deepcopy(code_env_def)
-                update(new_code_env_def, required_code_env_def)
+                new_code_env_def = merge(code_env_def, required_code_env_def)
 
-            if new_code_env_def != code_env_def:
+            if new_code_env_def is not code_env_def:
                 code_env.set_definition(new_code_env_def)
 
-            if (args.update or create or update_packages) and "NON_MANAGED" not in args.deployment_mode:
-                code_env.update_packages()
+            if create:
+                result["spec_fingerprint"] = get_code_env_spec_fingerprint(new_code_env_def, args.version)
+            if result["update_packages"]:
+                result["artifact_imported"] = False
+                if args.artifact is not None:
+                    result["artifact_imported"], artifact_reason = import_code_env_artifact_if_matching(
+                        args.artifact,
+                        args.env_path or get_code_env_path(args.datadir, args.lang, args.name, args.version),
+                        result["spec_fingerprint"],
+                    )
+                    result["update_reason"] = "{}, {}".format(result["update_reason"], artifact_reason)
+                if not result["artifact_imported"]:
+                    result["build_timings"] = update_code_env_packages(
+                        client,
+                        code_env,
+                        timeout=args.build_timeout,
+                        build_log=args.build_log,
+                        poll_interval=args.log_poll_interval,
+                    )
+
+                # Pin what was installed, the env is already built with it
+                if args.lockfile is not None and not result["lockfile_used"]:
+                    built_code_env_def = code_env.get_definition()
+                    pinned_spec = get_code_env_pinned_spec(built_code_env_def, args.version, args.package_source)
+                    result["lockfile_written"] = 0 < len(pinned_spec)
+                    if result["lockfile_written"]:
+                        write_code_env_lockfile(
+                            args.lockfile,
+                            {
+                                "lang": args.lang,
+                                "name": args.name,
+                                "version": args.version,
+                                "spec_fingerprint": lock_fingerprint,
+                                "pinned_spec": pinned_spec,
+                            },
+                        )
+                        versioned_built_code_env_def = (
+                            built_code_env_def[args.version] if args.version is not None else built_code_env_def
+                        )
+                        versioned_built_code_env_def.update(pinned_spec)
+                        code_env.set_definition(built_code_env_def)
+                        result["spec_fingerprint"] = get_code_env_spec_fingerprint(built_code_env_def, args.version)
+                state_store.set(state_key, result["spec_fingerprint"])
 
             if args.jupyter_support:
+                jupyter_start = time.time()
                 code_env.set_jupyter_support(args.jupyter_support)
+                result.setdefault("build_timings", {})["jupyter"] = time.time() - jupyter_start
 
             code_env_def = code_env.get_definition()
             result["dss_code_env"] = code_env_def
@@ -307,6 +486,10 @@ def run_module():
         if args.state == "absent" and exists:
             if exists:
                 code_env.delete()
+                state_store.delete(state_key)
+
+        if result["changed"]:
+            read_cache.invalidate("code_envs")
 
         module.exit_json(**result)
     except Exception as e:
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import os
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    export_code_env_artifact,
+    get_client_from_parsed_args,
+    get_code_env_path,
+    get_code_env_spec_fingerprint,
+    read_code_env_artifact_manifest,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_code_env_export
+
+short_description: Exports a built code env into a tarball
+
+description:
+    - "This module packs the directory of a built code env, with the fingerprint of its spec, into a tarball that
+      dss_code_env can import on other nodes with its 'artifact' parameter instead of installing the packages again."
+    - "It must run on the DSS node, as the owner of the datadir. The nodes importing the artifact must have their
+      code env at the same path, as virtualenvs are not relocatable."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    lang:
+        description:
+            - Either "PYTHON" or "R"
+        required: true
+    name:
+        description:
+            - Name of the code env
+        required: true
+    version:
+        description:
+            - The version to export on automation nodes
+        required: false
+    datadir:
+        description:
+            - The datadir of DSS. Mandatory if env_path is not used.
+        required: false
+    env_path:
+        description:
+            - The directory of the code env, by default "code-envs/{python|R}/{name}" in the datadir,
+              followed by "versions/{version}" if a version is set.
+        required: false
+    dest:
+        description:
+            - Path of the tarball to write.
+        required: true
+    force:
+        description:
+            - Write the tarball even if dest already holds an artifact with the same fingerprint.
+        required: false
+        default: false
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Export the code env built on the first automation node
+  become: true
+  become_user: dataiku
+  dss_code_env_export:
+    connect_to: "{{dss_connection_info}}"
+    datadir: /home/dataiku/dss
+    lang: PYTHON
+    name: basic-machine-learning
+    version: "2"
+    dest: /tmp/basic-machine-learning-2.tar.gz
+  run_once: true
+
+- name: Bring it back to the controller
+  fetch:
+    src: /tmp/basic-machine-learning-2.tar.gz
+    dest: artifacts/
+    flat: true
+  run_once: true
+"""
+
+RETURN = """
+dest:
+    description: The path of the tarball
+    type: str
+spec_fingerprint:
+    description: The fingerprint of the spec of the exported code env
+    type: str
+message:
+    description: EXPORTED or UNCHANGED
+    type: str
+"""
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        lang=dict(type="str", required=True),
+        name=dict(type="str", required=True),
+        version=dict(type="str", required=False, default=None),
+        datadir=dict(type="path", required=False, default=None),
+        env_path=dict(type="path", required=False, default=None),
+        dest=dict(type="path", required=True),
+        force=dict(type="bool", required=False, default=False),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    if args.lang not in ["PYTHON", "R"]:
+        module.fail_json(
+            msg="The lang attribute has invalid value '{}'. Must be either 'PYTHON' or 'R'.".format(args.lang)
+        )
+    if args.datadir is None and args.env_path is None:
+        module.fail_json(msg="One of datadir or env_path is mandatory")
+
+    result = dict(changed=False, message="UNCHANGED", dest=args.dest)
+
+    try:
+        client = get_client_from_parsed_args(module)
+        env_path = args.env_path or get_code_env_path(args.datadir, args.lang, args.name, args.version)
+        if not os.path.isdir(env_path):
+            module.fail_json(msg="Code env directory '{}' not found.".format(env_path))
+
+        code_env_def = client.get_code_env(args.lang, args.name).get_definition()
+        result["spec_fingerprint"] = get_code_env_spec_fingerprint(code_env_def, args.version)
+
+        if not args.force and os.path.isfile(args.dest):
+            try:
+                # Artifacts without external_links hold the links to the interpreter, which the import rejects
+                manifest = read_code_env_artifact_manifest(args.dest)
+                if manifest.get("spec_fingerprint") == result["spec_fingerprint"] and "external_links" in manifest:
+                    module.exit_json(**result)
+            except Exception:
+                pass
+
+        result["changed"] = True
+        result["message"] = "EXPORTED"
+        if module.check_mode:
+            module.exit_json(**result)
+
+        export_code_env_artifact(
+            env_path,
+            args.dest,
+            {
+                "lang": args.lang,
+                "name": args.name,
+                "version": args.version,
+                "env_path": env_path,
+                "spec_fingerprint": result["spec_fingerprint"],
+            },
+        )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
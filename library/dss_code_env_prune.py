@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    get_code_env_path,
+    get_code_env_state_key,
+    get_code_env_versions,
+    get_directory_size,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    list_code_env_usages,
+    remove_code_env_versions,
+    run_concurrently,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_code_env_prune
+
+short_description: Deletes the old versions of versioned code envs on automation nodes
+
+description:
+    - "For each AUTOMATION_VERSIONED code env, this module keeps the most recent versions and the versions still
+      referenced by a usage of the code env, and deletes the others: their sub-definition is removed from the code env
+      definition and their directory is removed from the datadir once DSS no longer lists them."
+    - "It must run on the automation node, as the owner of the datadir."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    datadir:
+        description:
+            - The datadir of DSS.
+        required: true
+    code_envs:
+        description:
+            - The code envs to prune, as dictionaries with the keys "name" and "lang". All the AUTOMATION_VERSIONED
+              code envs by default.
+        required: false
+    keep_versions:
+        description:
+            - Number of most recent versions always kept.
+        required: false
+        default: 3
+    concurrency:
+        description:
+            - Maximum number of code envs processed at the same time.
+        required: false
+        default: 4
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Keep only the last two versions of every code env
+  become: true
+  become_user: dataiku
+  dss_code_env_prune:
+    connect_to: "{{dss_connection_info}}"
+    datadir: /home/dataiku/dss
+    keep_versions: 2
+"""
+
+RETURN = """
+code_envs:
+    description: For each code env, by "LANG/name", its "kept_versions", "deleted_versions", "used_versions" and
+        "reclaimed_bytes"
+    type: dict
+reclaimed_bytes:
+    description: The disk space freed, or that would be freed in check mode
+    type: int
+errors:
+    description: The error of every code env that could not be pruned, by "LANG/name"
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+def prune_code_env(client, state_store, datadir, lang, name, keep_versions, check_mode):
+    code_env = client.get_code_env(lang, name)
+    code_env_def = code_env.get_definition()
+    versions = get_code_env_versions(code_env_def)
+
+    # Only the versions that would be deleted need their usages, the most recent ones are kept anyway
+    kept_versions = versions[-keep_versions:]
+    candidate_versions = [version for version in versions if version not in kept_versions]
+    used_versions = [
+        version for version in candidate_versions if 0 < len(list_code_env_usages(client, lang, name, version))
+    ]
+    deleted_versions = [version for version in candidate_versions if version not in used_versions]
+    env_result = {
+        "kept_versions": [version for version in versions if version not in deleted_versions],
+        "deleted_versions": deleted_versions,
+        "used_versions": used_versions,
+        "reclaimed_bytes": 0,
+    }
+
+    version_paths = dict((version, get_code_env_path(datadir, lang, name, version)) for version in deleted_versions)
+    if check_mode or 0 == len(deleted_versions):
+        for version_path in version_paths.values():
+            env_result["reclaimed_bytes"] += get_directory_size(version_path)
+        return env_result
+
+    # No API deletes a single version, drop it from the definition, then from the disk once DSS no longer lists it
+    code_env.set_definition(remove_code_env_versions(code_env_def, deleted_versions))
+    remaining_versions = get_code_env_versions(code_env.get_definition())
+    env_result["kept_versions"] = remaining_versions
+    env_result["deleted_versions"] = [version for version in deleted_versions if version not in remaining_versions]
+    for version in env_result["deleted_versions"]:
+        env_result["reclaimed_bytes"] += get_directory_size(version_paths[version])
+        if os.path.isdir(version_paths[version]):
+            shutil.rmtree(version_paths[version])
+        state_store.delete(get_code_env_state_key(lang, name, version))
+    return env_result
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        datadir=dict(type="path", required=True),
+        code_envs=dict(type="list", required=False, default=None),
+        keep_versions=dict(type="int", required=False, default=3),
+        concurrency=dict(type="int", required=False, default=4),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    if args.keep_versions < 1:
+        module.fail_json(msg="keep_versions must be at least 1, the current version of a code env cannot be deleted")
+
+    result = dict(changed=False, message="UNCHANGED", code_envs={}, reclaimed_bytes=0, errors={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+        state_store = get_state_store_from_parsed_args(module, "code_envs")
+
+        if args.code_envs is None:
+            targets = [
+                (env["envLang"], env["envName"])
+                for env in read_cache.get("code_envs", client.list_code_envs)
+                if env.get("deploymentMode", None) == "AUTOMATION_VERSIONED"
+            ]
+        else:
+            targets = [(code_env["lang"], code_env["name"]) for code_env in args.code_envs]
+
+        def prune(target):
+            lang, name = target
+            key = "{}/{}".format(lang, name)
+            try:
+                return (
+                    key,
+                    prune_code_env(client, state_store, args.datadir, lang, name, args.keep_versions, module.check_mode),
+                    None,
+                )
+            except Exception as e:
+                return key, None, str(e)
+
+        for key, env_result, error in run_concurrently(prune, targets, args.concurrency):
+            if error is not None:
+                result["errors"][key] = error
+                continue
+            result["code_envs"][key] = env_result
+            result["reclaimed_bytes"] += env_result["reclaimed_bytes"]
+            if 0 < len(env_result["deleted_versions"]):
+                result["changed"] = True
+
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+            if not module.check_mode:
+                read_cache.invalidate("code_envs")
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to prune code envs: {}".format(", ".join(sorted(result["errors"].keys()))), **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
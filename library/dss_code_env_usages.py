@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    get_code_env_state_key,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    list_code_env_usages,
+    run_concurrently,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_code_env_usages
+
+short_description: Finds what uses the code envs and deletes the unused ones
+
+description:
+    - "This module fetches the usages (projects, recipes, notebooks, plugins...) of every code env concurrently and
+      returns an index of the usages by code env. It can then delete, in the same run, the code envs that have none."
+    - "Code envs managed by plugins are never deleted, delete the plugin instead."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    code_envs:
+        description:
+            - The code envs to scan, as dictionaries with the keys "name" and "lang". All the code envs by default.
+        required: false
+    exclude:
+        description:
+            - Names of code envs never deleted.
+        required: false
+        default: []
+    delete_unused:
+        description:
+            - Delete the scanned code envs that have no usage.
+        required: false
+        default: false
+    concurrency:
+        description:
+            - Maximum number of requests at the same time.
+        required: false
+        default: 8
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Report the usages of all the code envs
+  dss_code_env_usages:
+    connect_to: "{{dss_connection_info}}"
+  register: code_env_usages
+
+- name: Delete the code envs used by nothing
+  dss_code_env_usages:
+    connect_to: "{{dss_connection_info}}"
+    delete_unused: true
+    exclude:
+      - basic-machine-learning
+"""
+
+RETURN = """
+usages:
+    description: The list of usages of each scanned code env, by "LANG/name"
+    type: dict
+unused:
+    description: The scanned code envs without usage, as "LANG/name"
+    type: list
+deleted:
+    description: The code envs deleted, or that would be deleted in check mode, as "LANG/name"
+    type: list
+errors:
+    description: The error of every code env that could not be scanned or deleted, by "LANG/name"
+    type: dict
+message:
+    description: DELETED or UNCHANGED
+    type: str
+"""
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        code_envs=dict(type="list", required=False, default=None),
+        exclude=dict(type="list", required=False, default=[]),
+        delete_unused=dict(type="bool", required=False, default=False),
+        concurrency=dict(type="int", required=False, default=8),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    result = dict(changed=False, message="UNCHANGED", usages={}, unused=[], deleted=[], errors={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+        deployment_modes = dict(
+            ((env["envLang"], env["envName"]), env.get("deploymentMode", None))
+            for env in read_cache.get("code_envs", client.list_code_envs)
+        )
+        if args.code_envs is None:
+            targets = sorted(deployment_modes.keys())
+        else:
+            targets = [(code_env["lang"], code_env["name"]) for code_env in args.code_envs]
+
+        def list_usages(target):
+            lang, name = target
+            try:
+                return target, list_code_env_usages(client, lang, name), None
+            except Exception as e:
+                return target, None, str(e)
+
+        to_delete = []
+        for (lang, name), usages, error in run_concurrently(list_usages, targets, args.concurrency):
+            key = "{}/{}".format(lang, name)
+            if error is not None:
+                result["errors"][key] = error
+                continue
+            result["usages"][key] = usages
+            if 0 == len(usages):
+                result["unused"].append(key)
+                if (
+                    args.delete_unused
+                    and name not in args.exclude
+                    and not (deployment_modes.get((lang, name), None) or "").startswith("PLUGIN_")
+                ):
+                    to_delete.append((lang, name))
+                    result["deleted"].append(key)
+
+        result["changed"] = 0 < len(to_delete)
+        if result["changed"]:
+            result["message"] = "DELETED"
+
+        if module.check_mode:
+            module.exit_json(**result)
+
+        if result["changed"]:
+            state_store = get_state_store_from_parsed_args(module, "code_envs")
+
+            def delete(target):
+                lang, name = target
+                try:
+                    client.get_code_env(lang, name).delete()
+                    state_store.delete(get_code_env_state_key(lang, name))
+                    return target, None
+                except Exception as e:
+                    return target, str(e)
+
+            for (lang, name), error in run_concurrently(delete, to_delete, args.concurrency):
+                if error is not None:
+                    key = "{}/{}".format(lang, name)
+                    result["errors"][key] = error
+                    result["deleted"].remove(key)
+            read_cache.invalidate("code_envs")
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to scan or delete code envs: {}".format(", ".join(sorted(result["errors"].keys()))),
+                **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
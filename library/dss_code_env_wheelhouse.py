@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_code_env_wheelhouse
+
+short_description: Fills a wheelhouse with the packages of python code envs
+
+description:
+    - "This module downloads with pip, into a directory of the target, the package lists of python code envs, so
+      that dss_code_env can install them with package_source set to this directory, without network access."
+    - "pip resolves each package list on its own, as it does when it builds the code env, so code envs pinning
+      different versions of a package all find theirs in the directory."
+    - "The download is skipped when the directory was already filled from the same package lists."
+    - "The core packages and the Jupyter support packages that DSS adds to a code env are not included, as they
+      depend on the DSS version. List them in the packages option to build such code envs offline."
+
+options:
+    dest:
+        description:
+            - The wheelhouse directory.
+        required: true
+    code_envs:
+        description:
+            - Code env specs, in the same shape as the dss_code_envs module parameter. Only the "package_list" of the
+              PYTHON ones is used.
+        required: false
+        default: []
+    packages:
+        description:
+            - Additional requirements to download, such as the core and Jupyter support packages of the code envs.
+        required: false
+        default: []
+    python:
+        description:
+            - The python interpreter running pip. It must match the interpreter of the code envs.
+        required: false
+        default: python3
+    pip_args:
+        description:
+            - Additional arguments of "pip download", such as "--index-url" or "--platform".
+        required: false
+        default: []
+    force:
+        description:
+            - Download even if the wheelhouse was already filled from the same package lists.
+        required: false
+        default: false
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Fill the wheelhouse of the node
+  become: true
+  become_user: dataiku
+  dss_code_env_wheelhouse:
+    dest: /data/wheelhouse
+    python: /usr/bin/python3.6
+    code_envs: "{{dss_code_envs_specs}}"
+
+- name: Build the code envs from it
+  dss_code_env:
+    connect_to: "{{dss_connection_info}}"
+    name: "{{item.name}}"
+    lang: "{{item.lang}}"
+    package_list: "{{item.package_list}}"
+    package_source: /data/wheelhouse
+  loop: "{{dss_code_envs_specs}}"
+"""
+
+RETURN = """
+requirements:
+    description: The union of the requirements downloaded, each package list being downloaded on its own
+    type: list
+fingerprint:
+    description: Fingerprint of the requirements, interpreter and pip arguments, stored in the wheelhouse
+    type: str
+message:
+    description: DOWNLOADED or UNCHANGED
+    type: str
+"""
+
+FINGERPRINT_FILE = ".dss-wheelhouse-fingerprint"
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        dest=dict(type="path", required=True),
+        code_envs=dict(type="list", required=False, default=[]),
+        packages=dict(type="list", required=False, default=[]),
+        python=dict(type="str", required=False, default="python3"),
+        pip_args=dict(type="list", required=False, default=[]),
+        force=dict(type="bool", required=False, default=False),
+    )
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    dest = module.params["dest"]
+    python = module.params["python"]
+    pip_args = module.params["pip_args"]
+
+    # One set of requirements per code env, pip options of the package lists are left out
+    requirement_sets = []
+    package_lists = [module.params["packages"]] + [
+        code_env_params.get("package_list", None) or []
+        for code_env_params in module.params["code_envs"]
+        if code_env_params.get("lang", "PYTHON") == "PYTHON"
+    ]
+    for package_list in package_lists:
+        requirement_set = sorted(
+            set(
+                requirement.strip()
+                for requirement in package_list
+                if requirement.strip() != "" and not requirement.strip().startswith(("-", "#"))
+            )
+        )
+        if 0 < len(requirement_set) and requirement_set not in requirement_sets:
+            requirement_sets.append(requirement_set)
+    requirements = sorted(set(requirement for requirement_set in requirement_sets for requirement in requirement_set))
+
+    fingerprint = hashlib.sha256(
+        json.dumps([python, pip_args, sorted(requirement_sets)]).encode("UTF-8")
+    ).hexdigest()
+    result = dict(changed=False, message="UNCHANGED", requirements=requirements, fingerprint=fingerprint)
+
+    try:
+        fingerprint_path = os.path.join(dest, FINGERPRINT_FILE)
+        if not module.params["force"] and os.path.isfile(fingerprint_path):
+            with open(fingerprint_path, "r") as fingerprint_file:
+                if fingerprint_file.read().strip() == fingerprint:
+                    module.exit_json(**result)
+
+        result["changed"] = True
+        result["message"] = "DOWNLOADED"
+        if module.check_mode or 0 == len(requirements):
+            module.exit_json(**result)
+
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        for requirement_set in requirement_sets:
+            fd, requirements_path = tempfile.mkstemp(suffix=".txt")
+            try:
+                with os.fdopen(fd, "w") as requirements_file:
+                    requirements_file.write("\n".join(requirement_set) + "\n")
+                process = subprocess.Popen(
+                    [python, "-m", "pip", "download", "--dest", dest, "-r", requirements_path] + pip_args,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                stdout, stderr = process.communicate()
+            finally:
+                os.remove(requirements_path)
+            if process.returncode != 0:
+                module.fail_json(
+                    msg="pip download of {} failed with code {}".format(", ".join(requirement_set), process.returncode),
+                    stdout=stdout.decode("UTF-8", "replace"),
+                    stderr=stderr.decode("UTF-8", "replace"),
+                    **result
+                )
+
+        with open(fingerprint_path, "w") as fingerprint_file:
+            fingerprint_file.write(fingerprint)
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
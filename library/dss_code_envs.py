@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import time
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    build_code_env_definition,
+    code_env_packages_changed,
+    get_client_from_parsed_args,
+    get_code_env_spec_fingerprint,
+    get_code_env_state_key,
+    get_code_env_update_reason,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    parse_code_env_update,
+    run_concurrently,
+    update_code_env_packages,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_code_envs
+
+short_description: Creates, updates or deletes many code envs at once
+
+description:
+    - "This module applies a list of code env specs, in the same shape as the dss_code_env module parameters.
+      The existing code envs are fetched with a single listing call, then the code envs are created, updated and
+      built several at a time."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    code_envs:
+        description:
+            - The list of code envs. Each item is a dictionary with the keys "name" and "lang" (mandatory), and any
+              parameter of the dss_code_env module such as "deployment_mode", "version", "package_list",
+              "conda_environment", "python_interpreter", "package_source", "build_log", "desc", "permissions", "update" or
+              "state".
+        required: true
+    update:
+        description:
+            - Default value of "update" for the code envs not specifying it. See dss_code_env.
+        required: false
+        default: true
+    concurrency:
+        description:
+            - Maximum number of code envs processed at the same time.
+        required: false
+        default: 4
+    build_timeout:
+        description:
+            - Maximum time in seconds of the update of the packages of each code env. See dss_code_env.
+        required: false
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Build the code envs of the automation node
+  dss_code_envs:
+    connect_to: "{{dss_connection_info}}"
+    concurrency: 6
+    update: auto
+    code_envs:
+      - name: basic-machine-learning
+        lang: PYTHON
+        deployment_mode: AUTOMATION_VERSIONED
+        version: "2"
+        python_interpreter: PYTHON36
+        package_list:
+          - scikit-learn>=0.20,<0.21
+          - scipy>=1.1,<1.2
+      - name: r-reporting
+        lang: R
+        deployment_mode: AUTOMATION_SINGLE
+        package_list:
+          - ggplot2
+      - name: old-env
+        lang: PYTHON
+        state: absent
+"""
+
+RETURN = """
+code_envs:
+    description: For each code env, by "LANG/name", its "message" (CREATED, MODIFIED, UNCHANGED or DELETED),
+        "update_packages", "update_reason", "spec_fingerprint" and "timings" in seconds, with the phases of the update
+        of the packages detailed as in dss_code_env
+    type: dict
+errors:
+    description: The error of every code env that could not be processed, by "LANG/name"
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+ALLOWED_CODE_ENV_KEYS = set(
+    [
+        "name",
+        "lang",
+        "state",
+        "deployment_mode",
+        "version",
+        "core_packages",
+        "jupyter_support",
+        "update",
+        "permissions",
+        "usable_by_all",
+        "owner",
+        "conda_environment",
+        "package_list",
+        "external_conda_env_name",
+        "python_interpreter",
+        "desc",
+        "package_source",
+        "build_log",
+    ]
+)
+
+
+def process_code_env(client, state_store, code_env_params, exists, check_mode, build_timeout):
+    lang = code_env_params["lang"]
+    name = code_env_params["name"]
+    version = code_env_params.get("version", None)
+    deployment_mode = code_env_params.get("deployment_mode", None)
+    state = code_env_params["state"]
+    state_key = get_code_env_state_key(lang, name, version)
+    env_result = {"message": "UNCHANGED", "timings": {}}
+    start = time.time()
+
+    code_env = None
+    code_env_def = {}
+    packages_changed = False
+    if exists:
+        code_env = client.get_code_env(lang, name)
+        code_env_def = code_env.get_definition()
+        if deployment_mode is None:
+            deployment_mode = code_env_def["deploymentMode"]
+    env_result["timings"]["definition"] = time.time() - start
+
+    if state == "absent":
+        if exists:
+            env_result["message"] = "DELETED"
+            if not check_mode:
+                code_env.delete()
+                state_store.delete(state_key)
+        env_result["timings"]["total"] = time.time() - start
+        return env_result
+
+    required_code_env_def, versioned_required_code_env_def = build_code_env_definition(code_env_params)
+    if exists and "NON_MANAGED" not in deployment_mode:
+        packages_changed = code_env_packages_changed(code_env_def, versioned_required_code_env_def, version)
+    new_code_env_def = merge(code_env_def, required_code_env_def)
+
+    if not exists:
+        env_result["message"] = "CREATED"
+    elif new_code_env_def is not code_env_def:
+        env_result["message"] = "MODIFIED"
+
+    env_result["spec_fingerprint"] = get_code_env_spec_fingerprint(new_code_env_def, version)
+    env_result["update_packages"], env_result["update_reason"] = get_code_env_update_reason(
+        code_env_params["update"],
+        deployment_mode,
+        not exists,
+        packages_changed,
+        state_store.get(state_key),
+        env_result["spec_fingerprint"],
+    )
+    if check_mode:
+        env_result["timings"]["total"] = time.time() - start
+        return env_result
+
+    if not exists:
+        if deployment_mode is None:
+            raise Exception("The argument deployment_mode is mandatory to create a code env")
+        if code_env_params.get("python_interpreter", None) is not None:
+            versioned_required_code_env_def["pythonInterpreter"] = code_env_params["python_interpreter"]
+        code_env = client.create_code_env(lang, name, deployment_mode, required_code_env_def)
+        code_env_def = code_env.get_definition()
+        new_code_env_def = merge(code_env_def, required_code_env_def)
+        env_result["spec_fingerprint"] = get_code_env_spec_fingerprint(new_code_env_def, version)
+
+    if new_code_env_def is not code_env_def:
+        code_env.set_definition(new_code_env_def)
+    env_result["timings"]["definition"] = time.time() - start
+
+    if env_result["update_packages"]:
+        env_result["timings"]["update_packages"] = update_code_env_packages(
+            client, code_env, timeout=build_timeout, build_log=code_env_params.get("build_log", None)
+        )
+        state_store.set(state_key, env_result["spec_fingerprint"])
+
+    if code_env_params.get("jupyter_support", True):
+        jupyter_start = time.time()
+        code_env.set_jupyter_support(True)
+        env_result["timings"]["jupyter_support"] = time.time() - jupyter_start
+
+    env_result["timings"]["total"] = time.time() - start
+    return env_result
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        code_envs=dict(type="list", required=True),
+        update=dict(type="raw", required=False, default=True),
+        concurrency=dict(type="int", required=False, default=4),
+        build_timeout=dict(type="float", required=False, default=None),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    required_keys = set()
+    for code_env_params in args.code_envs:
+        if not isinstance(code_env_params, dict) or code_env_params.get("name", None) is None:
+            module.fail_json(msg="Every item of 'code_envs' must be a dictionary with at least a 'name' key")
+        name = code_env_params["name"]
+        unknown_keys = set(code_env_params.keys()) - ALLOWED_CODE_ENV_KEYS
+        if 0 < len(unknown_keys):
+            module.fail_json(msg="Unknown keys for code env '{}': {}".format(name, ", ".join(sorted(unknown_keys))))
+        if code_env_params.get("package_source", None) is not None and code_env_params.get("lang", None) != "PYTHON":
+            module.fail_json(msg="The package_source attribute of code env '{}' is only supported for PYTHON".format(name))
+        if code_env_params.get("lang", None) not in ["PYTHON", "R"]:
+            module.fail_json(
+                msg="The lang attribute of code env '{}' has invalid value '{}'. Must be either 'PYTHON' or 'R'.".format(
+                    name, code_env_params.get("lang", None)
+                )
+            )
+        key = "{}/{}".format(code_env_params["lang"], name)
+        if key in required_keys:
+            module.fail_json(msg="Code env '{}' is listed more than once".format(key))
+        required_keys.add(key)
+        code_env_params.setdefault("state", "present")
+        if code_env_params["state"] not in ["present", "absent"]:
+            module.fail_json(
+                msg="Invalid value '{}' for state of code env '{}' : must be either 'present' or 'absent'".format(
+                    code_env_params["state"], key
+                )
+            )
+        try:
+            code_env_params["update"] = parse_code_env_update(code_env_params.get("update", args.update))
+        except TypeError:
+            module.fail_json(
+                msg="The update attribute of code env '{}' has invalid value '{}'. Must be either true, false or 'auto'.".format(
+                    key, code_env_params.get("update", args.update)
+                )
+            )
+
+    result = dict(changed=False, message="UNCHANGED", code_envs={}, errors={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+        state_store = get_state_store_from_parsed_args(module, "code_envs")
+        existing_keys = set(
+            "{}/{}".format(env["envLang"], env["envName"]) for env in read_cache.get("code_envs", client.list_code_envs)
+        )
+
+        def process(code_env_params):
+            key = "{}/{}".format(code_env_params["lang"], code_env_params["name"])
+            try:
+                env_result = process_code_env(
+                    client, state_store, code_env_params, key in existing_keys, module.check_mode, args.build_timeout
+                )
+                return key, env_result, None
+            except Exception as e:
+                return key, None, str(e)
+
+        for key, env_result, error in run_concurrently(process, args.code_envs, args.concurrency):
+            if error is not None:
+                result["errors"][key] = error
+                continue
+            result["code_envs"][key] = env_result
+            if env_result["message"] != "UNCHANGED" or env_result.get("update_packages", False):
+                result["changed"] = True
+
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+        if not module.check_mode and (result["changed"] or 0 < len(result["errors"])):
+            read_cache.invalidate("code_envs")
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to process code envs: {}".format(", ".join(sorted(result["errors"].keys()))), **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@
 from __future__ import absolute_import
 
 import collections
-import copy
 import re
 import time
 import traceback
@@ -11,10 +10,18 @@ import traceback
 import ansible.module_utils.dataiku_api_preload_imports
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.dataiku_utils import (
+    ENCRYPTED_FIELDS_LIST,
+    GENERIC_CONNECTION_TEMPLATE,
     MakeNamespace,
     add_dss_connection_args,
+    forget_encrypted_fields,
     get_client_from_parsed_args,
-    update,
+    get_encrypted_fields_fingerprints,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    skip_unchanged_encrypted_fields,
+    split_encrypted_fields,
 )
 from ansible.module_utils.dataikuapi.utils import DataikuException
 
@@ -68,6 +75,13 @@ options:
             - possible through the public API only.
         required: false
         default: false
+    skip_unchanged_encrypted_fields:
+        description:
+            - Keep a salted fingerprint of the encrypted fields last applied to the connection in the state
+              directory (see the README), and do not set them again while their value is the same. The connection
+              is then not written at every run. A value changed in DSS by other means is not detected.
+        required: false
+        default: false
 author:
     - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
 """
@@ -116,6 +130,9 @@ previous_connection_def:
 connection_def:
     description: The current values if the connection have not been deleted
     type: dict
+skipped_encrypted_fields:
+    description: The encrypted fields not set again because their fingerprint is the one last applied
+    type: list
 message:
     description: CREATED, MODIFIED, UNCHANGED or DELETED 
     type: str
@@ -123,29 +140,6 @@ message:
 
 
 
-connection_template = {
-    "allowManagedDatasets": True,
-    "allowManagedFolders": False,
-    "allowWrite": True,
-    "allowedGroups": [],
-    # "creationTag": {},
-    # "credentialsMode": "GLOBAL",
-    "detailsReadability": {"allowedGroups": [], "readableBy": "NONE"},
-    # "indexingSettings": {
-    # "indexForeignKeys": False,
-    # "indexIndices": False,
-    # "indexSystemTables": False
-    # },
-    "maxActivities": 0,
-    # "name": "",
-    "params": {},
-    # "type": "PostgreSQL",
-    "usableBy": "ALL",
-    "useGlobalProxy": False,
-}
-
-encrypted_fields_list = ["password"]
-
 def run_module():
     # define the available arguments/parameters that a user can pass to
     # the module
@@ -155,6 +149,7 @@ def run_module():
         type=dict(type="str", required=True),
         connection_args=dict(type="dict", default={}, required=False),
         set_encrypted_fields_at_creation_only=dict(type="bool", default=False, required=False),
+        skip_unchanged_encrypted_fields=dict(type="bool", default=False, required=False),
         # params=dict(type='dict', default={}, required=False),
     )
     add_dss_connection_args(module_args)
@@ -176,23 +171,30 @@ def run_module():
         create = False
         connection = client.get_connection(args.name)
         current_def = None
-        try:
-            current_def = connection.get_definition()
-        except DataikuException as e:
-            # if e.message.startswith("com.dataiku.dip.server.controllers.NotFoundException"):
-            if str(e) == "java.lang.IllegalArgumentException: Connection '{}' does not exist".format(args.name):
+        read_cache = get_read_cache_from_parsed_args(module)
+        if read_cache.enabled:
+            current_def = read_cache.get("connections", client.list_connections).get(args.name, None)
+            if current_def is None:
                 exists = False
                 if args.state == "present":
                     create = True
-            else:
+        else:
+            try:
+                current_def = connection.get_definition()
+            except DataikuException as e:
+                # if e.message.startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+                if str(e) == "java.lang.IllegalArgumentException: Connection '{}' does not exist".format(args.name):
+                    exists = False
+                    if args.state == "present":
+                        create = True
+                else:
+                    raise
+            except Exception as e:
                 raise
-        except Exception as e:
-            raise
 
-        current_def = None
         encrypted_fields_before_change = {"params": {}}
         if exists:
-            result["previous_group_def"] = current_def = connection.get_definition()
+            result["previous_group_def"] = current_def
             # Check this is the same type
             if current_def["type"] != type:
                 module.fail_json(
@@ -200,7 +202,7 @@ def run_module():
                 )
                 return
             # Remove some values from the current def
-            for field in encrypted_fields_list:
+            for field in ENCRYPTED_FIELDS_LIST:
                 encrypted_field_before_change = current_def["params"].get(field, None)
                 if encrypted_field_before_change is not None:
                     encrypted_fields_before_change["params"][field] = encrypted_field_before_change
@@ -212,30 +214,32 @@ def run_module():
                 # module.fail_json(msg="Connection '{}' does not exist and cannot be created without the '{}' parameter".format(args.name,mandatory_create_param))
                 pass
 
-        # Build the new definition
-        new_def = copy.deepcopy(current_def) if exists else connection_template  # Used for modification
-
-        # Apply every attribute except the password for now
-        new_def["name"] = args.name
-        update(new_def, args.connection_args)
+        # Build the new definition, every attribute except the encrypted ones for now
+        connection_args, encrypted_fields = split_encrypted_fields(args.connection_args)
+        new_def = merge(
+            merge(current_def if exists else GENERIC_CONNECTION_TEMPLATE, {"name": args.name}), connection_args
+        )
 
-        # Extract args that may be encrypted
-        encrypted_fields = {"params": {}}
-        for field in encrypted_fields_list:
-            value = new_def["params"].get(field, None)
-            if value is not None:
-                encrypted_fields["params"][field] = value
-                del new_def["params"][field]
+        # Do not set again the encrypted fields last applied with the same value
+        secrets_state = None
+        fingerprints = {}
+        if args.skip_unchanged_encrypted_fields:
+            secrets_state = get_state_store_from_parsed_args(module, "connection_secrets")
+            fingerprints = get_encrypted_fields_fingerprints(secrets_state, args.name, encrypted_fields)
+            if exists:
+                required_fields = set(encrypted_fields["params"].keys())
+                skip_unchanged_encrypted_fields(secrets_state, args.name, encrypted_fields, fingerprints)
+                result["skipped_encrypted_fields"] = sorted(required_fields - set(encrypted_fields["params"].keys()))
 
         # Prepare the result for dry-run mode
-        result["changed"] = create or (exists and args.state == "absent") or (exists and current_def != new_def)
+        result["changed"] = create or (exists and args.state == "absent") or (exists and new_def is not current_def)
         if result["changed"]:
             if create:
                 result["message"] = "CREATED"
             elif exists:
                 if args.state == "absent":
                     result["message"] = "DELETED"
-                elif current_def != new_def:
+                elif new_def is not current_def:
                     result["message"] = "MODIFIED"
 
         if args.state == "present":
@@ -247,26 +251,29 @@ def run_module():
         ## Apply the changes
         if result["changed"] or (0 < len(encrypted_fields["params"]) and exists):
             if create:
-                update(new_def, encrypted_fields)
+                new_def = merge(new_def, encrypted_fields)
                 connection = client.create_connection(args.name, type, new_def["params"])
-                def_after_creation = connection.get_definition()
-                update(def_after_creation, new_def)
-                connection.set_definition(def_after_creation)  # 2nd call to apply additional parameters
+                # 2nd call to apply additional parameters
+                connection.set_definition(merge(connection.get_definition(), new_def))
+                if secrets_state is not None:
+                    secrets_state.set_many(fingerprints)
             elif exists:
                 if args.state == "absent":
                     connection.delete()
-                elif current_def != new_def or (0 < len(encrypted_fields["params"]) and not args.set_encrypted_fields_at_creation_only):
-                    for field in encrypted_fields_list:
-                        new_def_value = encrypted_fields["params"].get(field, None)
-                        if new_def_value is not None:
-                            new_def["params"][field] = new_def_value
-                        else:
-                            new_def["params"][field] = encrypted_fields_before_change.get(field)
-                    result["message"] = str(connection.set_definition(new_def))
+                    if secrets_state is not None:
+                        forget_encrypted_fields(secrets_state, args.name)
+                elif new_def is not current_def or (0 < len(encrypted_fields["params"]) and not args.set_encrypted_fields_at_creation_only):
+                    # Encrypted fields not required are sent back as they were
+                    result["message"] = str(
+                        connection.set_definition(merge(merge(new_def, encrypted_fields_before_change), encrypted_fields))
+                    )
                     if 0 < len(encrypted_fields["params"]):
                         # no need to compare, encrypted fields change value if reset
                         result["changed"] = True
                         result["message"] = "MODIFIED"
+                        if secrets_state is not None:
+                            secrets_state.set_many(fingerprints)
+            read_cache.invalidate("connections")
 
         module.exit_json(**result)
     except Exception as e:
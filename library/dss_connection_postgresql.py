@@ -3,7 +3,6 @@
 from __future__ import absolute_import
 
 import collections
-import copy
 import re
 import time
 import traceback
@@ -13,8 +12,14 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.dataiku_utils import (
     MakeNamespace,
     add_dss_connection_args,
+    forget_encrypted_fields,
     get_client_from_parsed_args,
-    update,
+    get_connection_template,
+    get_encrypted_fields_fingerprints,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    skip_unchanged_encrypted_fields,
 )
 from ansible.module_utils.dataikuapi.utils import DataikuException
 
@@ -81,6 +86,13 @@ options:
             - Wether the connection is supposed to exist or not. Possible values are "present" and "absent"
         default: present
         required: false
+    skip_unchanged_encrypted_fields:
+        description:
+            - Keep a salted fingerprint of the password last applied to the connection in the state directory (see
+              the README), and do not set it again, nor read the connection back to compare it, while it is the
+              same. A password changed in DSS by other means is not detected.
+        required: false
+        default: false
 author:
     - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
 """
@@ -103,6 +115,9 @@ previous_connection_def:
 connection_def:
     description: The current values if the connection have not been deleted
     type: dict
+skipped_encrypted_fields:
+    description: ["password"] if the password was not set again because its fingerprint is the one last applied
+    type: list
 message:
     description: CREATED, MODIFIED, UNCHANGED or DELETED 
     type: str
@@ -110,36 +125,7 @@ message:
 
 
 
-connection_template = {
-    "allowManagedDatasets": True,
-    "allowManagedFolders": False,
-    "allowWrite": True,
-    "allowedGroups": [],
-    # "creationTag": {},
-    "credentialsMode": "GLOBAL",
-    "detailsReadability": {"allowedGroups": [], "readableBy": "NONE"},
-    "indexingSettings": {"indexForeignKeys": False, "indexIndices": False, "indexSystemTables": False},
-    "maxActivities": 0,
-    # "name": "",
-    "params": {
-        "autocommitMode": False,
-        # "db": "",
-        # "host": "",
-        "namingRule": {
-            "canOverrideSchemaInManagedDatasetCreation": False,
-            "tableNameDatasetNamePrefix": "${projectKey}_",
-        },
-        # "password": "",
-        "port": 5432,
-        "properties": [],
-        "useTruncate": False,
-        "useURL": False,
-        # "user": ""
-    },
-    "type": "PostgreSQL",
-    "usableBy": "ALL",
-    "useGlobalProxy": False,
-}
+connection_template = get_connection_template("PostgreSQL")
 
 
 def run_module():
@@ -154,6 +140,7 @@ def run_module():
         password=dict(type="str", required=False, no_log=True),
         database=dict(type="str", default=None, required=False),
         additional_args=dict(type="dict", default={}, required=False),
+        skip_unchanged_encrypted_fields=dict(type="bool", default=False, required=False),
     )
     add_dss_connection_args(module_args)
 
@@ -173,23 +160,30 @@ def run_module():
         create = False
         connection = client.get_connection(args.name)
         current_def = None
-        try:
-            current_def = connection.get_definition()
-        except DataikuException as e:
-            # if e.message.startswith("com.dataiku.dip.server.controllers.NotFoundException"):
-            if str(e) == "java.lang.IllegalArgumentException: Connection '{}' does not exist".format(args.name):
+        read_cache = get_read_cache_from_parsed_args(module)
+        if read_cache.enabled:
+            current_def = read_cache.get("connections", client.list_connections).get(args.name, None)
+            if current_def is None:
                 exists = False
                 if args.state == "present":
                     create = True
-            else:
+        else:
+            try:
+                current_def = connection.get_definition()
+            except DataikuException as e:
+                # if e.message.startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+                if str(e) == "java.lang.IllegalArgumentException: Connection '{}' does not exist".format(args.name):
+                    exists = False
+                    if args.state == "present":
+                        create = True
+                else:
+                    raise
+            except Exception as e:
                 raise
-        except Exception as e:
-            raise
 
-        current_def = None
         encrypted_password_before_change = None
         if exists:
-            result["previous_group_def"] = current_def = connection.get_definition()
+            result["previous_group_def"] = current_def
             # Check this is the same type
             if current_def["type"] != connection_template["type"]:
                 module.fail_json(
@@ -210,32 +204,43 @@ def run_module():
                             )
                         )
 
-        # Build the new definition
-        new_def = copy.deepcopy(current_def) if exists else connection_template  # Used for modification
-
-        # Apply every attribute except the password for now
-        new_def["name"] = args.name
-        if args.database is not None:
-            new_def["params"]["db"] = args.database
-        if args.user is not None:
-            new_def["params"]["user"] = args.user
-        if args.postgresql_host is not None:
-            new_def["params"]["host"] = args.postgresql_host
-        if args.postgresql_port is not None:
-            new_def["params"]["port"] = args.postgresql_port
+        # Build the new definition, every attribute except the password for now
+        required_def = {"name": args.name, "params": {}}
+        for key, value in [
+            ("db", args.database),
+            ("user", args.user),
+            ("host", args.postgresql_host),
+            ("port", args.postgresql_port),
+        ]:
+            if value is not None:
+                required_def["params"][key] = value
+        new_def = merge(current_def if exists else connection_template, required_def)
 
         # Bonus args
-        update(new_def, args.additional_args)
+        new_def = merge(new_def, args.additional_args)
+
+        # Do not set again the password last applied with the same value
+        secrets_state = None
+        fingerprints = {}
+        encrypted_fields = {"params": {"password": args.password} if args.password is not None else {}}
+        if args.skip_unchanged_encrypted_fields:
+            secrets_state = get_state_store_from_parsed_args(module, "connection_secrets")
+            fingerprints = get_encrypted_fields_fingerprints(secrets_state, args.name, encrypted_fields)
+            if exists:
+                skip_unchanged_encrypted_fields(secrets_state, args.name, encrypted_fields, fingerprints)
+                if args.password is not None and "password" not in encrypted_fields["params"]:
+                    result["skipped_encrypted_fields"] = ["password"]
+        required_password = encrypted_fields["params"].get("password", None)
 
         # Prepare the result for dry-run mode
-        result["changed"] = create or (exists and args.state == "absent") or (exists and current_def != new_def)
+        result["changed"] = create or (exists and args.state == "absent") or (exists and new_def is not current_def)
         if result["changed"]:
             if create:
                 result["message"] = "CREATED"
             elif exists:
                 if args.state == "absent":
                     result["message"] = "DELETED"
-                elif current_def != new_def:
+                elif new_def is not current_def:
                     result["message"] = "MODIFIED"
 
         if args.state == "present":
@@ -245,9 +250,9 @@ def run_module():
             module.exit_json(**result)
 
         ## Apply the changes
-        if result["changed"] or (args.password is not None and exists):
+        if result["changed"] or (required_password is not None and exists):
             if create:
-                new_def["params"]["password"] = args.password
+                new_def = merge(new_def, {"params": {"password": args.password}})
                 params = {
                     "db": args.database,
                     "user": args.user,
@@ -258,21 +263,25 @@ def run_module():
                     params["port"] = args.postgresql_port
                 connection = client.create_connection(args.name, connection_template["type"], params)
                 connection.set_definition(new_def)  # 2nd call to apply additional parameters
+                if secrets_state is not None:
+                    secrets_state.set_many(fingerprints)
             elif exists:
                 if args.state == "absent":
                     connection.delete()
-                elif current_def != new_def or args.password is not None:
-                    if args.password is not None:
-                        new_def["params"]["password"] = args.password
-                    else:
-                        new_def["params"]["password"] = encrypted_password_before_change
-                    result["message"] = str(connection.set_definition(new_def))
-                    if args.password is not None:
+                    if secrets_state is not None:
+                        forget_encrypted_fields(secrets_state, args.name)
+                elif new_def is not current_def or required_password is not None:
+                    password = required_password if required_password is not None else encrypted_password_before_change
+                    result["message"] = str(connection.set_definition(merge(new_def, {"params": {"password": password}})))
+                    if required_password is not None:
+                        if secrets_state is not None:
+                            secrets_state.set_many(fingerprints)
                         # Get again the definition to test again the encrypted pass
                         new_def_after_submit = connection.get_definition()
                         if encrypted_password_before_change != new_def_after_submit["params"]["password"]:
                             result["changed"] = True
                             result["message"] = "MODIFIED"
+            read_cache.invalidate("connections")
 
         module.exit_json(**result)
     except Exception as e:
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import time
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+    run_concurrently,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_connection_test
+
+short_description: Tests many Data Science Studio connections concurrently
+
+description:
+    - "This module tests a list of connections, or all of them, several at a time, and reports for each one whether
+      it works, the error if it does not, and the round-trip time of the test as seen from the module."
+    - "SQL connections are tested by running a trivial query through DSS, which opens a connection to the database.
+      The public API has no test for the other types, they are tested by reading the connection info, which checks
+      that DSS can load and resolve the connection but does not reach the storage."
+    - "The module never changes anything. It fails when the rate of failed tests is above max_failure_rate."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    connections:
+        description:
+            - Names of the connections to test. All the connections by default.
+        required: false
+    types:
+        description:
+            - Only test the connections of these types, such as "PostgreSQL" or "HDFS".
+        required: false
+    test_queries:
+        description:
+            - Query run to test the SQL connections, by connection type. Overrides the defaults, "SELECT 1" or its
+              equivalent for the databases requiring a FROM clause.
+        required: false
+        default: {}
+    concurrency:
+        description:
+            - Maximum number of connections tested at the same time.
+        required: false
+        default: 8
+    max_failure_rate:
+        description:
+            - Highest rate of failed tests, between 0 and 1, for which the module succeeds.
+        required: false
+        default: 0
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Check the connections, tolerating a few broken ones
+  dss_connection_test:
+    connect_to: "{{dss_connection_info}}"
+    concurrency: 16
+    max_failure_rate: 0.05
+  register: connection_tests
+
+- name: Check the SQL connections just provisioned
+  dss_connection_test:
+    connect_to: "{{dss_connection_info}}"
+    connections:
+      - postgres_dwh
+      - snowflake_sales
+"""
+
+RETURN = """
+connections:
+    description: For each connection name, its "type", the test "method" (sql_query or info), "success", "error"
+        and "latency" in seconds
+    type: dict
+failed_connections:
+    description: The names of the connections whose test failed
+    type: list
+failure_rate:
+    description: The rate of failed tests
+    type: float
+latency:
+    description: The "min", "mean", "p50", "p95" and "max" latency in seconds of the tests
+    type: dict
+message:
+    description: SUCCESS or FAILURE
+    type: str
+"""
+
+# Connection types tested with a query, and the query to use when "SELECT 1" is not valid
+SQL_CONNECTION_TYPES = set(
+    [
+        "PostgreSQL",
+        "Greenplum",
+        "Redshift",
+        "MySQL",
+        "SQLServer",
+        "Synapse",
+        "Oracle",
+        "Teradata",
+        "Vertica",
+        "Netezza",
+        "SAPHANA",
+        "DB2",
+        "Snowflake",
+        "BigQuery",
+        "Athena",
+        "ExasolDB",
+        "JDBC",
+    ]
+)
+SQL_TEST_QUERIES = {
+    "Oracle": "SELECT 1 FROM DUAL",
+    "DB2": "SELECT 1 FROM SYSIBM.SYSDUMMY1",
+    "SAPHANA": "SELECT 1 FROM DUMMY",
+}
+
+
+def test_connection(client, name, connection_type, test_queries):
+    connection_result = {"type": connection_type, "success": True, "error": None}
+    start = time.time()
+    try:
+        if connection_type in SQL_CONNECTION_TYPES:
+            connection_result["method"] = "sql_query"
+            query = client.sql_query(test_queries.get(connection_type, "SELECT 1"), connection=name)
+            for _ in query.iter_rows():
+                pass
+            query.verify()
+        else:
+            connection_result["method"] = "info"
+            client.get_connection(name).get_info()
+    except Exception as e:
+        connection_result["success"] = False
+        connection_result["error"] = str(e)
+    connection_result["latency"] = time.time() - start
+    return name, connection_result
+
+
+def get_latency_stats(latencies):
+    if 0 == len(latencies):
+        return {}
+    latencies = sorted(latencies)
+    return {
+        "min": latencies[0],
+        "mean": sum(latencies) / len(latencies),
+        "p50": latencies[(len(latencies) - 1) // 2],
+        "p95": latencies[int(round(0.95 * (len(latencies) - 1)))],
+        "max": latencies[-1],
+    }
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        connections=dict(type="list", required=False, default=None),
+        types=dict(type="list", required=False, default=None),
+        test_queries=dict(type="dict", required=False, default={}),
+        concurrency=dict(type="int", required=False, default=8),
+        max_failure_rate=dict(type="float", required=False, default=0.0),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    if not 0 <= args.max_failure_rate <= 1:
+        module.fail_json(msg="max_failure_rate must be between 0 and 1")
+
+    result = dict(
+        changed=False, message="SUCCESS", connections={}, failed_connections=[], failure_rate=0.0, latency={}
+    )
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+        current_defs = read_cache.get("connections", client.list_connections)
+        test_queries = dict(SQL_TEST_QUERIES)
+        test_queries.update(args.test_queries)
+
+        names = args.connections if args.connections is not None else sorted(current_defs.keys())
+        targets = []
+        for name in names:
+            if name not in current_defs:
+                result["connections"][name] = {
+                    "type": None,
+                    "method": None,
+                    "success": False,
+                    "error": "Connection '{}' does not exist".format(name),
+                    "latency": None,
+                }
+                continue
+            connection_type = current_defs[name].get("type", None)
+            if args.types is None or connection_type in args.types:
+                targets.append((name, connection_type))
+
+        for name, connection_result in run_concurrently(
+            lambda target: test_connection(client, target[0], target[1], test_queries), targets, args.concurrency
+        ):
+            result["connections"][name] = connection_result
+
+        result["failed_connections"] = sorted(
+            name for name, tested in result["connections"].items() if not tested["success"]
+        )
+        if 0 < len(result["connections"]):
+            result["failure_rate"] = float(len(result["failed_connections"])) / len(result["connections"])
+        result["latency"] = get_latency_stats(
+            [tested["latency"] for tested in result["connections"].values() if tested["latency"] is not None]
+        )
+
+        if result["failure_rate"] > args.max_failure_rate:
+            result["message"] = "FAILURE"
+            module.fail_json(
+                msg="{} of {} connections failed their test: {}".format(
+                    len(result["failed_connections"]),
+                    len(result["connections"]),
+                    ", ".join(result["failed_connections"]),
+                ),
+                **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    ENCRYPTED_FIELDS_LIST,
+    MakeNamespace,
+    add_dss_connection_args,
+    forget_encrypted_fields,
+    get_client_from_parsed_args,
+    get_connection_template,
+    get_encrypted_fields_fingerprints,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    pop_encrypted_fields,
+    run_concurrently,
+    skip_unchanged_encrypted_fields,
+    split_encrypted_fields,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_connections
+
+short_description: Creates, edit or delete many Data Science Studio connections at once
+
+description:
+    - "This module reconciles a list of connections with the content of DSS. Every connection definition is fetched
+      with a single listing call, the differences are computed in memory and only the connections that changed
+      are written, several at a time."
+    - "Each connection entry accepts the same keys as the dss_connection_generic module."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    connections:
+        description:
+            - The list of connections. Each item is a dictionary with the keys "name" and "type" (mandatory),
+              "connection_args" and "state", with the same meaning as the dss_connection_generic module parameters,
+              and "password".
+            - The "password" key sets the encrypted password field of the connection params and is never logged.
+              Prefer it to a password in the params of "connection_args", which Ansible logs with the invocation
+              before the module can mask it.
+        required: true
+    set_encrypted_fields_at_creation_only:
+        description:
+            - If a connection already exits, encrypted fields such as "password" are not set again.
+              See dss_connection_generic.
+        required: false
+        default: false
+    skip_unchanged_encrypted_fields:
+        description:
+            - Do not set again the encrypted fields whose salted fingerprint, kept in the state directory, is the one
+              last applied. See dss_connection_generic.
+        required: false
+        default: false
+    concurrency:
+        description:
+            - Maximum number of connections written at the same time.
+        required: false
+        default: 4
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Provision the connections
+  dss_connections:
+    connect_to: "{{dss_connection_info}}"
+    concurrency: 8
+    connections:
+      - name: hdfs_test
+        type: HDFS
+        connection_args:
+          params:
+            root: "/user/dataiku/test"
+            defaultDatabase: dataiku
+          usableBy: ALLOWED
+          allowedGroups:
+            - data_team
+      - name: postgres_dwh
+        type: PostgreSQL
+        password: "{{dwh_password}}"
+        connection_args:
+          params:
+            host: dwh.internal.example.com
+            db: dwh
+            user: dataiku
+      - name: filesystem_managed
+        type: Filesystem
+        state: absent
+"""
+
+RETURN = """
+connections:
+    description: For each connection name, CREATED, MODIFIED, UNCHANGED or DELETED
+    type: dict
+connection_defs:
+    description: The new definitions of the created or modified connections, without encrypted fields
+    type: dict
+previous_connection_defs:
+    description: The previous definitions of the modified or deleted connections, without encrypted fields
+    type: dict
+skipped_encrypted_fields:
+    description: For each connection name, the encrypted fields not set again because their fingerprint is the one
+        last applied
+    type: dict
+errors:
+    description: The error of every connection that could not be written, by name
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+
+def apply_change(client, change):
+    action, name, connection_type, new_def, encrypted_fields = change
+    try:
+        if action == "CREATED":
+            new_def = merge(new_def, encrypted_fields)
+            connection = client.create_connection(name, connection_type, new_def["params"])
+            # 2nd call to apply additional parameters
+            connection.set_definition(merge(connection.get_definition(), new_def))
+        elif action == "DELETED":
+            client.get_connection(name).delete()
+        else:
+            client.get_connection(name).set_definition(merge(new_def, encrypted_fields))
+    except Exception as e:
+        return name, str(e)
+    return name, None
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        connections=dict(
+            type="list",
+            required=True,
+            elements="dict",
+            options=dict(
+                name=dict(type="str", required=True),
+                type=dict(type="str", required=False, default=None),
+                connection_args=dict(type="dict", required=False, default={}),
+                password=dict(type="str", required=False, default=None, no_log=True),
+                state=dict(type="str", required=False, default="present"),
+            ),
+        ),
+        set_encrypted_fields_at_creation_only=dict(type="bool", default=False, required=False),
+        skip_unchanged_encrypted_fields=dict(type="bool", default=False, required=False),
+        concurrency=dict(type="int", default=4, required=False),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    required_names = set()
+    for connection_params in args.connections:
+        name = connection_params["name"]
+        if name in required_names:
+            module.fail_json(msg="Connection '{}' is listed more than once".format(name))
+        required_names.add(name)
+        connection_params["connection_args"] = connection_params["connection_args"] or {}
+        params = connection_params["connection_args"].get("params", None) or {}
+        if params.get("password", None) is not None:
+            module.no_log_values.add(params["password"])
+            module.warn("Use the 'password' key of connection '{}' instead of a password in its params".format(name))
+        if connection_params["password"] is not None:
+            connection_params["connection_args"] = merge(
+                connection_params["connection_args"], {"params": {"password": connection_params["password"]}}
+            )
+        if connection_params["state"] not in ["present", "absent"]:
+            module.fail_json(
+                msg="Invalid value '{}' for state of connection '{}' : must be either 'present' or 'absent'".format(
+                    connection_params["state"], name
+                )
+            )
+        if connection_params["state"] == "present" and connection_params["type"] is None:
+            module.fail_json(msg="The 'type' of connection '{}' is mandatory".format(name))
+
+    result = dict(
+        changed=False,
+        message="UNCHANGED",
+        connections={},
+        connection_defs={},
+        previous_connection_defs={},
+        skipped_encrypted_fields={},
+        errors={},
+    )
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+        current_defs = read_cache.get("connections", client.list_connections)
+        secrets_state = None
+        if args.skip_unchanged_encrypted_fields:
+            secrets_state = get_state_store_from_parsed_args(module, "connection_secrets")
+        fingerprints = {}
+
+        # Compute the deltas
+        changes = []
+        for connection_params in args.connections:
+            name = connection_params["name"]
+            connection_type = connection_params["type"]
+            current_def = current_defs.get(name, None)
+            if connection_params["state"] == "absent":
+                if current_def is not None:
+                    pop_encrypted_fields(current_def)
+                    changes.append(("DELETED", name, None, None, None))
+                    result["connections"][name] = "DELETED"
+                    result["previous_connection_defs"][name] = current_def
+                else:
+                    result["connections"][name] = "UNCHANGED"
+                continue
+
+            if current_def is not None:
+                # Check this is the same type
+                if current_def["type"] != connection_type:
+                    module.fail_json(
+                        msg="Connection '{}' already exists but is of type '{}'".format(name, current_def["type"])
+                    )
+                encrypted_fields_before_change = pop_encrypted_fields(current_def)
+
+            # Apply every attribute except the encrypted ones for now
+            connection_args, encrypted_fields = split_encrypted_fields(connection_params["connection_args"])
+            new_def = merge(
+                merge(current_def if current_def is not None else get_connection_template(connection_type), {"name": name}),
+                connection_args,
+            )
+
+            # Do not set again the encrypted fields last applied with the same value
+            if secrets_state is not None:
+                fingerprints[name] = get_encrypted_fields_fingerprints(secrets_state, name, encrypted_fields)
+                if current_def is not None:
+                    required_fields = set(encrypted_fields["params"].keys())
+                    skip_unchanged_encrypted_fields(secrets_state, name, encrypted_fields, fingerprints[name])
+                    skipped_fields = sorted(required_fields - set(encrypted_fields["params"].keys()))
+                    if 0 < len(skipped_fields):
+                        result["skipped_encrypted_fields"][name] = skipped_fields
+
+            if current_def is None:
+                action = "CREATED"
+            elif new_def is not current_def:
+                action = "MODIFIED"
+            elif 0 < len(encrypted_fields["params"]) and not args.set_encrypted_fields_at_creation_only:
+                # no need to compare, encrypted fields change value if reset
+                action = "MODIFIED"
+            else:
+                result["connections"][name] = "UNCHANGED"
+                continue
+
+            if current_def is not None:
+                for field in ENCRYPTED_FIELDS_LIST:
+                    if field not in encrypted_fields["params"] and field in encrypted_fields_before_change["params"]:
+                        encrypted_fields["params"][field] = encrypted_fields_before_change["params"][field]
+                result["previous_connection_defs"][name] = current_def
+            changes.append((action, name, connection_type, new_def, encrypted_fields))
+            result["connections"][name] = action
+            result["connection_defs"][name] = new_def
+
+        # Prepare the result for dry-run mode
+        result["changed"] = 0 < len(changes)
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+
+        if module.check_mode:
+            module.exit_json(**result)
+
+        # Apply the changes
+        for name, error in run_concurrently(lambda change: apply_change(client, change), changes, args.concurrency):
+            if error is not None:
+                result["errors"][name] = error
+            elif secrets_state is not None:
+                if result["connections"][name] == "DELETED":
+                    forget_encrypted_fields(secrets_state, name)
+                else:
+                    secrets_state.set_many(fingerprints[name])
+        if result["changed"]:
+            read_cache.invalidate("connections")
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to write connections: {}".format(", ".join(sorted(result["errors"].keys()))), **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import json
+import os
+import time
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+    pop_encrypted_fields,
+    run_concurrently,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_facts
+
+short_description: Gathers a snapshot of a Data Science Studio instance
+
+description:
+    - "This module fetches the users, groups, connections, code envs, plugins, general settings and API deployer
+      infrastructures of DSS concurrently, with a single client, and returns them as facts."
+    - "The encrypted fields of the connections are not returned."
+    - "If the read cache is enabled (see the README), the fetched users, groups, connections and code envs are
+      stored in it for the next tasks."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    gather_subset:
+        description:
+            - The parts of the instance to fetch. Any of "users", "groups", "connections", "code_envs", "plugins",
+              "general_settings", "api_deployer_infras", or "all".
+        required: false
+        default: ["all"]
+    concurrency:
+        description:
+            - Maximum number of listings fetched at the same time.
+        required: false
+        default: 7
+    dest:
+        description:
+            - If set, the snapshot is written in this JSON file (mode 0600) on the machine running the module
+              instead of being returned as facts.
+        required: false
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Gather the state of the instance
+  dss_facts:
+    connect_to: "{{dss_connection_info}}"
+    gather_subset:
+      - users
+      - groups
+
+- name: Show the users
+  debug:
+    var: dss_facts.users
+
+- name: Dump everything in a file on the target
+  dss_facts:
+    connect_to: "{{dss_connection_info}}"
+    dest: /home/dataiku/dss-snapshot.json
+"""
+
+RETURN = """
+ansible_facts:
+    description: The snapshot as a "dss_facts" dictionary with one key per gathered subset, if dest is not set
+    type: dict
+timings:
+    description: The time in seconds taken to fetch each subset
+    type: dict
+dest:
+    description: The file where the snapshot was written, if dest is set
+    type: str
+"""
+
+
+def list_connections(client, read_cache):
+    connections = client.list_connections()
+    read_cache.put("connections", connections)
+    for connection_def in connections.values():
+        pop_encrypted_fields(connection_def)
+    return connections
+
+
+# Listings also stored in the read cache, to be used by the next tasks
+def cached_listing(resource_type, loader):
+    def load(client, read_cache):
+        value = loader(client)
+        read_cache.put(resource_type, value)
+        return value
+
+    return load
+
+
+FACTS_LOADERS = {
+    "users": cached_listing("users", lambda client: client.list_users()),
+    "groups": cached_listing("groups", lambda client: client.list_groups()),
+    "connections": list_connections,
+    "code_envs": cached_listing("code_envs", lambda client: client.list_code_envs()),
+    "plugins": lambda client, read_cache: client.list_plugins(),
+    "general_settings": lambda client, read_cache: client.get_general_settings().settings,
+    "api_deployer_infras": lambda client, read_cache: client.get_apideployer().list_infras(as_objects=False),
+}
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        gather_subset=dict(type="list", required=False, default=["all"]),
+        concurrency=dict(type="int", required=False, default=7),
+        dest=dict(type="path", required=False, default=None),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    subsets = sorted(FACTS_LOADERS.keys()) if "all" in args.gather_subset else args.gather_subset
+    unknown_subsets = set(subsets) - set(FACTS_LOADERS.keys())
+    if 0 < len(unknown_subsets):
+        module.fail_json(
+            msg="Invalid values '{}' for gather_subset : must be among '{}' or 'all'".format(
+                "', '".join(sorted(unknown_subsets)), "', '".join(sorted(FACTS_LOADERS.keys()))
+            )
+        )
+
+    result = dict(changed=False, timings={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        read_cache = get_read_cache_from_parsed_args(module)
+
+        def load(subset):
+            start = time.time()
+            try:
+                return subset, FACTS_LOADERS[subset](client, read_cache), None, time.time() - start
+            except Exception as e:
+                return subset, None, str(e), time.time() - start
+
+        facts = {}
+        errors = {}
+        for subset, value, error, duration in run_concurrently(load, subsets, args.concurrency):
+            result["timings"][subset] = duration
+            if error is not None:
+                errors[subset] = error
+            else:
+                facts[subset] = value
+
+        if 0 < len(errors):
+            module.fail_json(
+                msg="Failed to gather {}: {}".format(
+                    ", ".join(sorted(errors.keys())), "; ".join("{}: {}".format(k, v) for k, v in sorted(errors.items()))
+                ),
+                **result
+            )
+
+        if args.dest is not None:
+            fd = os.open(args.dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as dest_file:
+                json.dump(facts, dest_file)
+            result["dest"] = args.dest
+        else:
+            result["ansible_facts"] = {"dss_facts": facts}
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    wait_for_futures,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_future_wait
+
+short_description: Waits for several DSS jobs at once
+
+description:
+    - "This module polls a list of DSS future jobs together, such as the ones returned by dss_plugin with
+      wait: false, until they all finish. The polling interval grows while no job finishes and goes back to
+      its initial value as soon as one does."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    job_ids:
+        description:
+            - The ids of the jobs to wait for.
+        required: true
+    timeout:
+        description:
+            - Maximum time to wait in seconds. No limit by default.
+        required: false
+    abort_on_timeout:
+        description:
+            - Abort the jobs still running when the timeout expires.
+        required: false
+        default: false
+    initial_interval:
+        description:
+            - Initial polling interval in seconds.
+        required: false
+        default: 1
+    max_interval:
+        description:
+            - Maximum polling interval in seconds.
+        required: false
+        default: 30
+    backoff:
+        description:
+            - Factor applied to the polling interval while no job finishes.
+        required: false
+        default: 1.5
+    fail_on_error:
+        description:
+            - Fail the task if a job failed or timed out.
+        required: false
+        default: true
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Start the plugin installs
+  dss_plugin:
+    connect_to: "{{dss_connection_info}}"
+    plugin_id: "{{item}}"
+    wait: false
+  loop:
+    - timeseries-preparation
+    - geoadmin
+  register: plugin_installs
+
+- name: Wait for all of them
+  dss_future_wait:
+    connect_to: "{{dss_connection_info}}"
+    job_ids: "{{plugin_installs.results | map(attribute='job_ids') | flatten}}"
+    timeout: 1800
+"""
+
+RETURN = """
+jobs:
+    description: For each job id, its "status" (DONE, FAILED or TIMEOUT), "result", "error" and "duration" in seconds
+    type: dict
+message:
+    description: DONE or FAILED
+    type: str
+"""
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        job_ids=dict(type="list", required=True),
+        timeout=dict(type="float", required=False, default=None),
+        abort_on_timeout=dict(type="bool", required=False, default=False),
+        initial_interval=dict(type="float", required=False, default=1.0),
+        max_interval=dict(type="float", required=False, default=30.0),
+        backoff=dict(type="float", required=False, default=1.5),
+        fail_on_error=dict(type="bool", required=False, default=True),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    result = dict(changed=False, message="DONE", jobs={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        job_ids = [job_id for job_id in args.job_ids if job_id is not None]
+        if module.check_mode:
+            module.exit_json(**result)
+
+        result["jobs"] = wait_for_futures(
+            client,
+            job_ids,
+            timeout=args.timeout,
+            initial_interval=args.initial_interval,
+            max_interval=args.max_interval,
+            backoff=args.backoff,
+            abort_on_timeout=args.abort_on_timeout,
+        )
+        failed_jobs = sorted(job_id for job_id, job in result["jobs"].items() if job["status"] != "DONE")
+        if 0 < len(failed_jobs):
+            result["message"] = "FAILED"
+            if args.fail_on_error:
+                module.fail_json(msg="Jobs failed or timed out: {}".format(", ".join(failed_jobs)), **result)
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
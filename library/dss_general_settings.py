@@ -15,7 +15,7 @@ from ansible.module_utils.dataiku_utils import (
     add_dss_connection_args,
     extract_keys,
     get_client_from_parsed_args,
-    update,
+    merge_changes,
 )
 from ansible.module_utils.dataikuapi.utils import DataikuException
 
@@ -29,6 +29,8 @@ short_description: Set up general settings values
 
 description:
     - "This module edits DSS general settings"
+    - "The settings are only saved, and DSS only reloads them, if one of the required values differs from the
+      current one. The whole settings document is then sent, the API does not accept partial updates."
 
 options:
     connect_to:
@@ -97,6 +99,9 @@ previous_settings:
 dss_general_settings:
     description: Return the current values after update
     type: dict
+changed_paths:
+    description: The paths of the required settings whose value changed, as dot separated keys
+    type: list
 message:
     description: MODIFIED or UNCHANGED
     type: str
@@ -126,16 +131,18 @@ def run_module():
 
         # Prepare the result for dry-run mode
         result["previous_settings"] = current_values
-        result["dss_general_settings"] = general_settings.settings
-        result["changed"] = current_values != args.settings
+        new_settings, changes = merge_changes(general_settings.settings, args.settings)
+        result["dss_general_settings"] = new_settings
+        result["changed_paths"] = [".".join(str(key) for key in path) for path, _, _ in changes]
+        result["changed"] = 0 < len(result["changed_paths"])
         if result["changed"]:
             result["message"] = "MODIFIED"
 
-        if module.check_mode:
+        if module.check_mode or not result["changed"]:
             module.exit_json(**result)
 
         # Apply the changes
-        update(general_settings.settings, args.settings)
+        general_settings.settings = new_settings
         general_settings.save()
         module.exit_json(**result)
     except Exception as e:
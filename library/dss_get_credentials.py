@@ -3,6 +3,7 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import imp
 import json
 import logging
@@ -34,6 +35,12 @@ options:
             - The name of the api key to look for. No effect for now.
         required: false
         default: "dss-ansible-admin"
+    use_cache:
+        description:
+            - Cache the API Key in DATADIR/run/ansible-credentials-cache.json (mode 0600) so that the next runs
+              do not start the DSS CLI. The cache is invalidated as soon as the DSS API keys store changes.
+        required: false
+        default: true
 
 author:
     - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
@@ -60,6 +67,9 @@ port:
 api_key:
     description: An admin valid API Key
     type: str
+cached:
+    description: True if the API Key was read from the cache without starting the DSS CLI
+    type: bool
 """
 
 
@@ -69,12 +79,41 @@ class MakeNamespace(object):
         self.__dict__.update(values)
 
 
+# Fingerprint of the file where DSS stores its API keys, None if it cannot be found
+def get_keystore_fingerprint(datadir, nodetype):
+    keystore_path = "{}/config/{}".format(datadir, "adminkeys.json" if nodetype == "api" else "public-apikeys.json")
+    if not os.path.isfile(keystore_path):
+        return None
+    with open(keystore_path, "rb") as keystore_file:
+        return hashlib.sha256(keystore_file.read()).hexdigest()
+
+
+def read_cache(cache_path):
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        return {}
+
+
+def write_cache(cache_path, cache):
+    tmp_path = "{}.tmp".format(cache_path)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as cache_file:
+        json.dump(cache, cache_file)
+    os.chmod(tmp_path, 0o600)
+    os.rename(tmp_path, cache_path)
+
+
 def run_module():
     # define the available arguments/parameters that a user can pass to
     # the module
     module_args = dict(
         datadir=dict(type="str", required=True),
         api_key_name=dict(type="str", required=False, default="dss-ansible-admin"),
+        use_cache=dict(type="bool", required=False, default=True),
     )
 
     module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
@@ -109,6 +148,19 @@ def run_module():
         nodetype = config.get("general", "nodetype").strip()
         logging.info("Reads port {} from install.ini".format(port))
 
+        # Use the cached key if the keys store did not change since it was cached
+        cache_path = "{}/run/ansible-credentials-cache.json".format(args.datadir)
+        keystore_fingerprint = get_keystore_fingerprint(args.datadir, nodetype) if args.use_cache else None
+        cache = {}
+        if keystore_fingerprint is not None:
+            cache = read_cache(cache_path)
+            if cache.get("keystore_fingerprint", None) != keystore_fingerprint:
+                cache = {"keystore_fingerprint": keystore_fingerprint, "keys": {}}
+            cached_api_key = cache["keys"].get(args.api_key_name, None)
+            if cached_api_key is not None:
+                logging.info('Found cached API Key labeled "{}".'.format(args.api_key_name))
+                module.exit_json(changed=False, port=port, api_key=cached_api_key, cached=True)
+
         # Create/Get the api key
         changed = False
         api_key = None
@@ -149,8 +201,16 @@ def run_module():
                 logging.info('Created new API Key labeled "{}".'.format(args.api_key_name))
             changed = True
 
+        # Update the cache, the fingerprint changes if the key was just created
+        if keystore_fingerprint is not None and api_key is not None and not module.check_mode:
+            keystore_fingerprint = get_keystore_fingerprint(args.datadir, nodetype)
+            if cache["keystore_fingerprint"] != keystore_fingerprint:
+                cache = {"keystore_fingerprint": keystore_fingerprint, "keys": {}}
+            cache["keys"][args.api_key_name] = api_key
+            write_cache(cache_path, cache)
+
         # Build result
-        result = dict(changed=changed, port=port, api_key=api_key,)
+        result = dict(changed=changed, port=port, api_key=api_key, cached=False)
 
         module.exit_json(**result)
     except Exception as e:
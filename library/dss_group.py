@@ -2,14 +2,19 @@
 
 from __future__ import absolute_import
 
-import copy
-import re
 import time
 import traceback
 
 import ansible.module_utils.dataiku_api_preload_imports
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.dataiku_utils import MakeNamespace, add_dss_connection_args, get_client_from_parsed_args
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    build_group_definition_args,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+    merge,
+)
 from ansible.module_utils.dataikuapi.dss.admin import DSSGroup
 from ansible.module_utils.dataikuapi.dssclient import DSSClient
 from ansible.module_utils.dataikuapi.utils import DataikuException
@@ -298,44 +303,43 @@ def run_module():
         exists = True
         create = False
         current = None
-        try:
-            current = group.get_definition()
-        except DataikuException as e:
-            if str(e).startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+        read_cache = get_read_cache_from_parsed_args(module)
+        if read_cache.enabled:
+            for listed_group in read_cache.get("groups", client.list_groups):
+                if listed_group["name"] == args.name:
+                    current = listed_group
+                    break
+            if current is None:
                 exists = False
                 if args.state == "present":
                     create = True
-            else:
+        else:
+            try:
+                current = group.get_definition()
+            except DataikuException as e:
+                if str(e).startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+                    exists = False
+                    if args.state == "present":
+                        create = True
+                else:
+                    raise
+            except:
                 raise
-        except:
-            raise
 
-        # Sort groups list before comparison as they should be considered sets
         if exists:
-            current["ldapGroupNames"] = sorted(current.get("ldapGroupNames", []))
             result["previous_group_def"] = current
-        # Build the new user definition
-        new_def = copy.deepcopy(current) if exists else {}  # Used for modification
-
-        # Transform to camel case
-        dict_args = {}
-        if args.ldap_group_names is not None:
-            dict_args["ldapGroupNames"] = sorted(args.ldap_group_names)
-        for key, value in module.params.items():
-            if key not in ["connect_to", "host", "port", "api_key", "state", "ldap_group_names"] and value is not None:
-                camelKey = re.sub(r"_[a-zA-Z]", lambda x: x.group()[1:].upper(), key)
-                dict_args[camelKey] = value
-        new_def.update(dict_args)
+        # Build the new group definition, ldapGroupNames are compared as sets
+        new_def = merge(current if exists else {"name": args.name}, build_group_definition_args(module.params))
 
         # Prepare the result for dry-run mode
-        result["changed"] = create or (exists and args.state == "absent") or (exists and current != new_def)
+        result["changed"] = create or (exists and args.state == "absent") or (exists and new_def is not current)
         if result["changed"]:
             if create:
                 result["message"] = "CREATED"
             elif exists:
                 if args.state == "absent":
                     result["message"] = "DELETED"
-                elif current != new_def:
+                elif new_def is not current:
                     result["message"] = "MODIFIED"
 
         if args.state == "present":
@@ -350,7 +354,7 @@ def run_module():
                 new_group = client.create_group(
                     args.name,
                     description=new_def.get("description", None),
-                    source_type=new_def.get("source_type", "LOCAL"),
+                    source_type=new_def.get("sourceType", "LOCAL"),
                 )
                 # 2nd request mandatory for capabilites TODO: fix the API
                 if "mayWriteSafeCode" not in list(new_def.keys()):
@@ -360,8 +364,9 @@ def run_module():
             elif exists:
                 if args.state == "absent":
                     group.delete()
-                elif current != new_def:
+                elif new_def is not current:
                     result["message"] = str(group.set_definition(new_def))
+            read_cache.invalidate("groups")
 
         module.exit_json(**result)
     except Exception as e:
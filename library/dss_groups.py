@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    build_group_definition_args,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+    merge,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_groups
+
+short_description: Creates, edit or delete many Data Science Studio groups at once
+
+description:
+    - "This module reconciles a list of groups with the content of DSS. The current groups are fetched with a single
+      listing call and only the groups whose definition actually differs are sent to DSS."
+    - "Each group entry accepts the same keys as the dss_group module."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    groups:
+        description:
+            - The list of groups. Each item is a dictionary with the key "name" (mandatory), "state" and any
+              parameter of the dss_group module such as "description", "admin", "ldap_group_names" or the
+              "may_*" capabilities.
+        required: true
+    purge:
+        description:
+            - Delete the existing groups that are not part of the "groups" list.
+        default: false
+        required: false
+    purge_exclude:
+        description:
+            - Group names never deleted by "purge".
+        default: ["administrators"]
+        required: false
+
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Reconcile the groups
+  dss_groups:
+    connect_to: "{{dss_connection_info}}"
+    groups:
+      - name: data_team
+        ldap_group_names:
+          - data-scientists
+        may_create_projects: true
+        may_write_unsafe_code: false
+      - name: readers
+        may_create_projects: false
+      - name: legacy_team
+        state: absent
+"""
+
+RETURN = """
+groups:
+    description: For each group name, CREATED, MODIFIED, UNCHANGED or DELETED
+    type: dict
+group_defs:
+    description: The new definitions of the created or modified groups, by name
+    type: dict
+previous_group_defs:
+    description: The previous definitions of the modified or deleted groups, by name
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        groups=dict(
+            type="list",
+            required=True,
+            elements="dict",
+            options=dict(
+                name=dict(type="str", required=True),
+                state=dict(type="str", required=False, default="present"),
+                description=dict(type="str", required=False, default=None),
+                source_type=dict(type="str", required=False, default=None),
+                ldap_group_names=dict(type="list", required=False, default=None),
+                admin=dict(type="bool", required=False, default=None),
+                may_create_authenticated_connections=dict(type="bool", required=False, default=None),
+                may_create_code_envs=dict(type="bool", required=False, default=None),
+                may_create_clusters=dict(type="bool", required=False, default=None),
+                may_create_projects=dict(type="bool", required=False, default=None),
+                may_create_projects_from_macros=dict(type="bool", required=False, default=None),
+                may_create_projects_from_templates=dict(type="bool", required=False, default=None),
+                may_create_projects_from_dataiku_apps=dict(type="bool", required=False, default=None),
+                may_create_published_API_services=dict(type="bool", required=False, default=None),
+                may_create_published_projects=dict(type="bool", required=False, default=None),
+                may_create_active_web_content=dict(type="bool", required=False, default=None),
+                may_develop_plugins=dict(type="bool", required=False, default=None),
+                may_edit_lib_folders=dict(type="bool", required=False, default=None),
+                may_manage_code_envs=dict(type="bool", required=False, default=None),
+                may_manage_clusters=dict(type="bool", required=False, default=None),
+                may_manage_UDM=dict(type="bool", required=False, default=None),
+                may_view_indexed_hive_connections=dict(type="bool", required=False, default=None),
+                may_write_safe_code=dict(type="bool", required=False, default=None),
+                may_write_unsafe_code=dict(type="bool", required=False, default=None),
+                may_write_in_root_project_folder=dict(type="bool", required=False, default=None),
+                can_obtain_API_ticket_from_cookies_for_groups_regex=dict(type="str", required=False, default=None),
+            ),
+        ),
+        purge=dict(type="bool", required=False, default=False),
+        purge_exclude=dict(type="list", required=False, default=["administrators"]),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    # Validate and transform to camel case in a single pass
+    required_groups = []
+    required_names = set()
+    for group_params in args.groups:
+        name = group_params["name"]
+        if name in required_names:
+            module.fail_json(msg="Group '{}' is listed more than once".format(name))
+        required_names.add(name)
+        state = group_params["state"]
+        if state not in ["present", "absent"]:
+            module.fail_json(
+                msg="Invalid value '{}' for state of group '{}' : must be either 'present' or 'absent'".format(state, name)
+            )
+        if group_params["source_type"] not in [None, "LOCAL", "LDAP", "SAAS"]:
+            module.fail_json(
+                msg="Invalid value '{}' for source_type of group '{}' : must be either 'LOCAL', 'LDAP' or 'SAAS'".format(
+                    group_params["source_type"], name
+                )
+            )
+        required_groups.append((name, state, build_group_definition_args(group_params)))
+
+    result = dict(changed=False, message="UNCHANGED", groups={}, group_defs={}, previous_group_defs={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        current_groups = {}
+        read_cache = get_read_cache_from_parsed_args(module)
+        for current_group in read_cache.get("groups", client.list_groups):
+            current_groups[current_group["name"]] = current_group
+
+        # Compute the deltas
+        to_create = []
+        to_modify = []
+        to_delete = []
+        for name, state, dict_args in required_groups:
+            current = current_groups.get(name, None)
+            if state == "absent":
+                if current is not None:
+                    to_delete.append(name)
+                    result["groups"][name] = "DELETED"
+                    result["previous_group_defs"][name] = current
+                else:
+                    result["groups"][name] = "UNCHANGED"
+                continue
+
+            # ldapGroupNames are compared as sets
+            new_def = merge(current if current is not None else {"name": name}, dict_args)
+            if current is None:
+                # 2nd request mandatory for capabilites TODO: fix the API
+                if "mayWriteSafeCode" not in new_def:
+                    new_def["mayWriteSafeCode"] = True
+                to_create.append((name, new_def))
+                result["groups"][name] = "CREATED"
+                result["group_defs"][name] = new_def
+            elif new_def is not current:
+                to_modify.append((name, new_def))
+                result["groups"][name] = "MODIFIED"
+                result["group_defs"][name] = new_def
+                result["previous_group_defs"][name] = current
+            else:
+                result["groups"][name] = "UNCHANGED"
+
+        if args.purge:
+            for name, current in current_groups.items():
+                if name not in required_names and name not in args.purge_exclude:
+                    to_delete.append(name)
+                    result["groups"][name] = "DELETED"
+                    result["previous_group_defs"][name] = current
+
+        # Prepare the result for dry-run mode
+        result["changed"] = 0 < len(to_create) + len(to_modify) + len(to_delete)
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+
+        if module.check_mode:
+            module.exit_json(**result)
+
+        # Apply the changes
+        for name, new_def in to_create:
+            new_group = client.create_group(
+                name, description=new_def.get("description", None), source_type=new_def.get("sourceType", "LOCAL"),
+            )
+            new_group.set_definition(new_def)
+        for name, new_def in to_modify:
+            client.get_group(name).set_definition(new_def)
+        for name in to_delete:
+            client.get_group(name).delete()
+        if result["changed"]:
+            read_cache.invalidate("groups")
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
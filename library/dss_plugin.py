@@ -1,4 +1,3 @@
-import copy
 import re
 import time
 import traceback
@@ -10,7 +9,15 @@ from ansible.module_utils.dataiku_utils import (
     add_dss_connection_args,
     extract_keys,
     get_client_from_parsed_args,
-    update,
+    get_future_result,
+    get_plugin_pending_job_key,
+    get_plugin_source_fingerprint,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    peek_future_state,
+    plugin_has_code_env,
+    start_plugin_install,
 )
 from ansible.module_utils.dataikuapi.utils import DataikuException
 
@@ -54,7 +61,7 @@ options:
         required: False
     zip_file:
         description:
-            - Path to Zip file
+            - Path to Zip file. It is streamed from the disk when uploaded.
         required: False
     git_repository_url:
         description:
@@ -77,14 +84,23 @@ options:
         required: false
     force:
         description:
-            - For install: Force an update based on describes sources even if already installed
+            - For install: Force an update based on describes sources even if already installed. For a zip file or a
+              git repository, the update is skipped if the sha256 of the zip or the commit of git_checkout is the one
+              last installed by this module, as recorded in the state directory (see the README).
             - For delete: Force delete even if usage is detected
         required: false
     install_code_env:
         description:
-            - Installs the code-env if the plugin expects one. Warning: it only works
-              at effective install or update. If the plugin is already installed and 
-              not updated, and the code-env is not installed, this will be ineffective.
+            - Installs the code-env if the plugin expects one and it has none yet, as told by the installed plugin.
+        required: False
+        default: True
+    wait:
+        description:
+            - Wait for the DSS jobs (install, update, code env creation, delete) to finish. If false, the task
+              returns as soon as the first job is started, with its id in "job_ids", and the following steps
+              (code env creation, settings) are not applied. The job is recorded in the state directory: run the
+              task again once it is done, for instance after dss_future_wait, to record the installed source and
+              apply the next steps. While the job runs, the task only returns its id again.
         required: False
         default: True
 author:
@@ -110,6 +126,15 @@ dss_plugin:
 job_results:
     description: A list for the results of DSSFuture calls implicated if there is any
     type: list
+job_ids:
+    description: The ids of the DSS jobs started and not waited for, when wait is false
+    type: list
+source_fingerprint:
+    description: The sha256 of the zip file or the commit of the git repository, if it could be computed
+    type: str
+update_skipped:
+    description: True if force is set but the source is the one already installed
+    type: bool
 message:
     description: CREATED, DELETED, MODIFIED or UNMODIFIED
     type: str
@@ -129,6 +154,7 @@ def run_module():
         settings=dict(type="dict", required=False, default={}),
         force=dict(type="bool", required=False, default=False),
         install_code_env=dict(type="bool", required=False, default=True),
+        wait=dict(type="bool", required=False, default=True),
     )
     add_dss_connection_args(module_args)
 
@@ -158,14 +184,60 @@ def run_module():
 
         if exists:
             plugin = client.get_plugin(args.plugin_id)
-            current_settings = copy.deepcopy(plugin.get_settings().get_raw())
+            current_settings = plugin.get_settings().get_raw()
+
+        # Identify the content of the source to avoid updating from the same one again
+        state_store = get_state_store_from_parsed_args(module, "plugins")
+        read_cache = get_read_cache_from_parsed_args(module)
+        source_fingerprint = None
+        if args.state == "present":
+            source_fingerprint = get_plugin_source_fingerprint(
+                args.zip_file, args.git_repository_url, args.git_checkout, args.git_subpath
+            )
+        result["source_fingerprint"] = source_fingerprint
+        result["job_results"] = []
+        result["job_ids"] = []
+        last_fingerprint = state_store.get(args.plugin_id)
+
+        # Resume from the job started by a previous run with wait: false
+        pending_job_key = get_plugin_pending_job_key(args.plugin_id)
+        pending_job = state_store.get(pending_job_key) if args.state == "present" else None
+        code_env_install_result = None
+        if pending_job is not None:
+            job_state = peek_future_state(client, pending_job["job_id"])
+            if job_state is not None and not job_state.get("hasResult", False) and job_state.get("alive", True):
+                result["job_ids"].append(pending_job["job_id"])
+                module.exit_json(**result)
+            if job_state is not None:
+                job_done = job_state.get("hasResult", False)
+            else:
+                # Already collected by DSS, an install is done if the plugin is there
+                job_done = pending_job["action"] == "update" or (pending_job["action"] == "install" and exists)
+            if job_done and pending_job["action"] in ["install", "update"]:
+                last_fingerprint = pending_job.get("source_fingerprint", None)
+                if not module.check_mode and last_fingerprint is not None:
+                    state_store.set(args.plugin_id, last_fingerprint)
+            if job_done and pending_job["action"] == "code_env" and job_state is not None:
+                code_env_install_result = job_state.get("result", None)
+                result["job_results"].append(code_env_install_result)
+            if not module.check_mode:
+                state_store.delete(pending_job_key)
+
+        result["update_skipped"] = (
+            exists
+            and args.force
+            and source_fingerprint is not None
+            and last_fingerprint == source_fingerprint
+        )
+
+        # The installed plugin tells whether it has a code env, also when a previous run did not wait for its install
+        if exists and args.state == "present" and args.install_code_env:
+            create_code_env = plugin_has_code_env(plugin_dict[args.plugin_id])
 
         # Prepare the result for dry-run mode
-        new_settings = copy.deepcopy(current_settings)
-        if args.settings is not None:
-            update(new_settings, args.settings)
-        
-        result["changed"] = create or (exists and (args.state == "absent" or (args.settings is not None and new_settings != current_settings) or (create_code_env and "codeEnvName" not in current_settings)))
+        new_settings = merge(current_settings, args.settings or {})
+
+        result["changed"] = create or (exists and (args.state == "absent" or (args.settings is not None and new_settings is not current_settings) or (create_code_env and "codeEnvName" not in current_settings) or code_env_install_result is not None))
         if result["changed"]:
             if create:
                 result["message"] = "CREATED"
@@ -177,77 +249,87 @@ def run_module():
                 else:
                     result["message"] = "UNMODIFIED"
 
-        result["job_results"] = []
         result["dss_plugin"] = {
             "id": args.plugin_id,
         }
         if exists:
             result["dss_plugin"]["settings"] = new_settings
-            update(result["dss_plugin"], plugin_dict[args.plugin_id])
+            result["dss_plugin"] = merge(result["dss_plugin"], plugin_dict[args.plugin_id])
 
         if module.check_mode:
             module.exit_json(**result)
 
+        # Waits for a job, or records it for the next run and returns its id when wait is false
+        def wait_or_defer(future, action):
+            if args.wait or future.job_id is None:
+                return get_future_result(future)
+            state_store.set(
+                pending_job_key, {"job_id": future.job_id, "action": action, "source_fingerprint": source_fingerprint}
+            )
+            result["job_ids"].append(future.job_id)
+            module.exit_json(**result)
+
         # Apply the changes
         if args.state == "present":
-            plugin_desc = {}
-            if not exists:
-                future = None
-                if args.zip_file is not None:
-                    future = client.install_plugin_from_archive(args.zip_file)
-                elif args.git_repository_url is not None:
-                    future = client.install_plugin_from_git(args.git_repository_url, args.git_checkout, args.git_subpath)
-                else:
-                    # Install from store
-                    future = client.install_plugin_from_store(args.plugin_id)
-                result["job_results"].append(future.wait_for_result())
-                plugin_desc = result["job_results"][-1].get("pluginDesc")
+            job_plugin_desc = {}
+            future = None
+            if not exists or (args.force and not result["update_skipped"]):
+                future = start_plugin_install(
+                    client,
+                    args.plugin_id,
+                    exists,
+                    args.zip_file,
+                    args.git_repository_url,
+                    args.git_checkout,
+                    args.git_subpath,
+                )
+
+            if future is not None:
+                result["job_results"].append(wait_or_defer(future, "update" if exists else "install"))
+                job_plugin_desc = (result["job_results"][-1] or {}).get("pluginDesc", None) or {}
+                if source_fingerprint is not None:
+                    state_store.set(args.plugin_id, source_fingerprint)
 
                 # Required to relist for the meta
                 plugins = client.list_plugins()
                 plugin_dict = { plugin['id']: plugin for plugin in plugins }
                 plugin = client.get_plugin(args.plugin_id)
-                update(result["dss_plugin"], plugin_dict[args.plugin_id])
-
-            elif args.force:
-                future = None
-                if args.zip_file is not None:
-                    future = plugin.update_from_zip(args.zip_file)
-                elif args.git_repository_url is not None:
-                    future = plugin.update_from_git(args.git_repository_url, args.git_checkout, args.git_subpath)
-                else:
-                    # Install from store
-                    future = plugin.update_from_store()
-                result["job_results"].append(future.wait_for_result())
-                plugin_desc = result["job_results"][-1].get("pluginDesc")
-
-            # Force refetch settings
-            current_settings = copy.deepcopy(plugin.get_settings().get_raw())
-            new_settings = copy.deepcopy(current_settings)
-            if args.settings is not None:
-                update(new_settings, args.settings)
-
-            if "codeEnvSpec" in plugin_desc and args.install_code_env:
-                create_code_env = True
+                result["dss_plugin"] = merge(result["dss_plugin"], plugin_dict[args.plugin_id])
+
+            # Force refetch settings, the same handle is used to save them
+            settings_handle = plugin.get_settings()
+            current_settings = settings_handle.get_raw()
+            new_settings = merge(current_settings, args.settings or {})
+
+            if args.install_code_env:
+                create_code_env = plugin_has_code_env(plugin_dict[args.plugin_id]) or plugin_has_code_env(
+                    job_plugin_desc
+                )
             result["dss_plugin"]["settings"] = new_settings
 
-        code_env_install_result = None
-        if args.state == "present" and create_code_env and "codeEnvName" not in new_settings:
+        if args.state == "present" and create_code_env and code_env_install_result is None and "codeEnvName" not in new_settings:
             future = plugin.create_code_env()
-            code_env_install_result = future.wait_for_result()
-            new_settings["codeEnvName"] = code_env_install_result.get("envName")
+            read_cache.invalidate("code_envs")
+            code_env_install_result = wait_or_defer(future, "code_env")
             result["job_results"].append(code_env_install_result)
+        if args.state == "present" and code_env_install_result is not None:
+            read_cache.invalidate("code_envs")
+            new_settings = merge(new_settings, {"codeEnvName": code_env_install_result.get("envName")})
 
-        if (args.settings is not None or code_env_install_result is not None) and args.state == "present" and new_settings != current_settings:
-            settings_handle = plugin.get_settings()
-            update(settings_handle.settings, new_settings)
+        if (args.settings is not None or code_env_install_result is not None) and args.state == "present" and new_settings is not current_settings:
+            settings_handle.settings = new_settings
             settings_handle.save()
             result["dss_plugin"]["settings"] = new_settings
 
         if args.state == "absent" and exists:
+            state_store.delete(args.plugin_id)
+            state_store.delete(get_plugin_pending_job_key(args.plugin_id))
             future = plugin.delete(force=args.force)
             if future.job_id is not None:
-                result["job_results"].append(future.wait_for_result())
+                if args.wait:
+                    result["job_results"].append(future.wait_for_result())
+                else:
+                    result["job_ids"].append(future.job_id)
 
         module.exit_json(**result)
     except Exception as e:
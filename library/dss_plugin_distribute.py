@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+import zipfile
+
+import ansible.module_utils.dataiku_api_preload_imports
+import requests
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    HTTP_SETTINGS,
+    MakeNamespace,
+    get_client,
+    install_plugin_from_zip_file,
+    resolve_git_commit,
+    run_concurrently,
+    update_plugin_from_zip_file,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_plugin_distribute
+
+short_description: Downloads a plugin archive once and installs it on many DSS nodes
+
+description:
+    - "This module is meant to run once on the controller. It fetches the zip of a plugin, from a URL or a git
+      repository, into a local cache keyed by plugin id and version, then uploads it to every node, several at a
+      time. The nodes do not need any access to the plugin store or to the git repository."
+    - "A node is left untouched if the plugin is already installed with the same version, unless force is set. The
+      code env and settings of the plugin can then be handled by dss_plugin on each node."
+
+options:
+    plugin_id:
+        description:
+            - ID of the plugin
+        required: true
+    version:
+        description:
+            - Version of the plugin, used as cache key. For a git repository, defaults to the commit git_checkout
+              points to. The installed version is compared with the version in the plugin.json of the archive, or
+              with this one if the archive has none.
+        required: false
+    url:
+        description:
+            - URL from which to download the zip of the plugin.
+        required: false
+    zip_file:
+        description:
+            - Path of the zip of the plugin on the controller, copied into the cache.
+        required: false
+    git_repository_url:
+        description:
+            - URL of the git repository to build the zip from.
+        required: false
+    git_checkout:
+        description:
+            - Branch, tag or commit to checkout
+        required: false
+        default: master
+    git_subpath:
+        description:
+            - Subpath in the repo where to find the plugin
+        required: false
+    cache_dir:
+        description:
+            - Directory of the cache of plugin archives.
+        required: false
+        default: ~/.cache/dataiku-ansible-modules/plugins
+    nodes:
+        description:
+            - The DSS nodes, as dictionaries with the keys "host" (mandatory), "port" (default 80) and "api_key"
+              (mandatory), and optionally the HTTP settings described in the README ("use_https", "verify_tls",
+              "pool_size", "max_retries", "connect_timeout", "read_timeout"). Only the API keys are masked in the
+              output.
+        required: true
+    concurrency:
+        description:
+            - Maximum number of nodes receiving the plugin at the same time.
+        required: false
+        default: 4
+    force:
+        description:
+            - Update the plugin even if the installed version is the same.
+        required: false
+        default: false
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Install the plugin on all the nodes from the controller
+  dss_plugin_distribute:
+    plugin_id: timeseries-preparation
+    version: 1.0.4
+    url: "https://plugins.example.com/timeseries-preparation-1.0.4.zip"
+    nodes:
+      - host: dss-automation-1.example.com
+        port: 10000
+        api_key: "{{automation_1_api_key}}"
+      - host: dss-automation-2.example.com
+        port: 10000
+        api_key: "{{automation_2_api_key}}"
+        use_https: true
+    concurrency: 8
+  delegate_to: localhost
+  run_once: true
+"""
+
+RETURN = """
+archive:
+    description: The path of the plugin archive in the cache
+    type: str
+downloaded:
+    description: True if the archive was not in the cache yet
+    type: bool
+plugin_version:
+    description: The version of the plugin in the archive, compared with the version installed on the nodes
+    type: str
+nodes:
+    description: For each node, by "host:port", its "message" (INSTALLED, UPDATED or UNCHANGED) and "duration"
+    type: dict
+errors:
+    description: The error of every node where the plugin could not be installed, by "host:port"
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+
+def download_archive(url, dest):
+    response = requests.get(url, stream=True, timeout=(10, 300))
+    response.raise_for_status()
+    with open(dest, "wb") as archive:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            archive.write(chunk)
+
+
+# git clone --branch only takes branches and tags, a commit is fetched alone, or with all the refs if the server
+# does not serve commits by id
+def checkout_git_commit(repository_url, commit, repo_dir):
+    subprocess.check_output(["git", "init", "--quiet", repo_dir])
+    try:
+        subprocess.check_output(
+            ["git", "-C", repo_dir, "fetch", "--quiet", "--depth", "1", repository_url, commit],
+            stderr=subprocess.STDOUT,
+        )
+    except subprocess.CalledProcessError:
+        subprocess.check_output(
+            ["git", "-C", repo_dir, "fetch", "--quiet", "--tags", repository_url, "+refs/heads/*:refs/remotes/origin/*"]
+        )
+    subprocess.check_output(["git", "-C", repo_dir, "checkout", "--quiet", commit])
+
+
+def build_archive_from_git(repository_url, checkout, subpath, dest):
+    work_dir = tempfile.mkdtemp()
+    try:
+        repo_dir = os.path.join(work_dir, "repo")
+        try:
+            subprocess.check_output(
+                ["git", "clone", "--quiet", "--depth", "1", "--branch", checkout, repository_url, repo_dir],
+                stderr=subprocess.STDOUT,
+            )
+        except subprocess.CalledProcessError:
+            repo_dir = os.path.join(work_dir, "commit")
+            checkout_git_commit(repository_url, checkout, repo_dir)
+        plugin_dir = os.path.join(repo_dir, subpath) if subpath else repo_dir
+        with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as archive:
+            for root, dirs, files in os.walk(plugin_dir):
+                dirs[:] = [directory for directory in dirs if directory != ".git"]
+                for file_name in files:
+                    file_path = os.path.join(root, file_name)
+                    archive.write(file_path, os.path.relpath(file_path, plugin_dir))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+# Version in the plugin.json of a plugin archive, at its root or in its top directory, None if there is none
+def get_archive_plugin_version(archive_path):
+    with zipfile.ZipFile(archive_path) as archive:
+        descriptors = sorted(
+            (name for name in archive.namelist() if name.split("/")[-1] == "plugin.json" and name.count("/") <= 1),
+            key=lambda name: name.count("/"),
+        )
+        if 0 == len(descriptors):
+            return None
+        return json.loads(archive.read(descriptors[0]).decode("UTF-8")).get("version", None)
+
+
+def install_on_node(node, plugin_id, version, archive_path, force):
+    start = time.time()
+    http_settings = dict((setting, node[setting]) for setting in HTTP_SETTINGS if node.get(setting, None) is not None)
+    client = get_client(node["host"], node["port"], node["api_key"], **http_settings)
+    installed = dict((plugin["id"], plugin) for plugin in client.list_plugins()).get(plugin_id, None)
+    if installed is None:
+        install_plugin_from_zip_file(client, archive_path).wait_for_result()
+        message = "INSTALLED"
+    elif force or installed.get("version", None) != version:
+        update_plugin_from_zip_file(client, plugin_id, archive_path).wait_for_result()
+        message = "UPDATED"
+    else:
+        message = "UNCHANGED"
+    return {"message": message, "duration": time.time() - start}
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        plugin_id=dict(type="str", required=True),
+        version=dict(type="str", required=False, default=None),
+        url=dict(type="str", required=False, default=None),
+        zip_file=dict(type="path", required=False, default=None),
+        git_repository_url=dict(type="str", required=False, default=None),
+        git_checkout=dict(type="str", required=False, default="master"),
+        git_subpath=dict(type="str", required=False, default=None),
+        cache_dir=dict(type="path", required=False, default="~/.cache/dataiku-ansible-modules/plugins"),
+        nodes=dict(
+            type="list",
+            required=True,
+            elements="dict",
+            options=dict(
+                host=dict(type="str", required=True),
+                port=dict(type="int", required=False, default=80),
+                api_key=dict(type="str", required=True, no_log=True),
+                use_https=dict(type="bool", required=False, default=None),
+                verify_tls=dict(type="raw", required=False, default=None),
+                pool_size=dict(type="int", required=False, default=None),
+                max_retries=dict(type="int", required=False, default=None),
+                connect_timeout=dict(type="raw", required=False, default=None),
+                read_timeout=dict(type="raw", required=False, default=None),
+            ),
+        ),
+        concurrency=dict(type="int", required=False, default=4),
+        force=dict(type="bool", required=False, default=False),
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        required_one_of=[["url", "zip_file", "git_repository_url"]],
+        mutually_exclusive=[["url", "zip_file", "git_repository_url"]],
+    )
+
+    args = MakeNamespace(module.params)
+
+    result = dict(changed=False, message="UNCHANGED", downloaded=False, nodes={}, errors={})
+
+    try:
+        version = args.version
+        if version is None and args.git_repository_url is not None:
+            version = resolve_git_commit(args.git_repository_url, args.git_checkout)
+        if version is None:
+            module.fail_json(msg="The version of the plugin is mandatory unless it comes from a reachable git repository")
+
+        # Fetch the archive once
+        archive_path = os.path.join(args.cache_dir, args.plugin_id, "{}.zip".format(version))
+        result["archive"] = archive_path
+        if not os.path.isfile(archive_path):
+            result["downloaded"] = True
+            if module.check_mode:
+                module.exit_json(**result)
+            if not os.path.isdir(os.path.dirname(archive_path)):
+                os.makedirs(os.path.dirname(archive_path))
+            tmp_path = "{}.{}.tmp".format(archive_path, os.getpid())
+            try:
+                if args.url is not None:
+                    download_archive(args.url, tmp_path)
+                elif args.zip_file is not None:
+                    shutil.copyfile(args.zip_file, tmp_path)
+                else:
+                    build_archive_from_git(args.git_repository_url, args.git_checkout, args.git_subpath, tmp_path)
+                os.rename(tmp_path, archive_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        if module.check_mode:
+            module.exit_json(**result)
+
+        # The nodes report the version of the plugin.json, not the cache key, which is a commit for git
+        plugin_version = get_archive_plugin_version(archive_path)
+        if plugin_version is None:
+            plugin_version = version
+        result["plugin_version"] = plugin_version
+
+        # Push it to all the nodes
+        def install(node):
+            key = "{}:{}".format(node["host"], node["port"])
+            try:
+                return key, install_on_node(node, args.plugin_id, plugin_version, archive_path, args.force), None
+            except Exception as e:
+                return key, None, str(e)
+
+        for key, node_result, error in run_concurrently(install, args.nodes, args.concurrency):
+            if error is not None:
+                result["errors"][key] = error
+                continue
+            result["nodes"][key] = node_result
+            if node_result["message"] != "UNCHANGED":
+                result["changed"] = True
+
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to install the plugin on: {}".format(", ".join(sorted(result["errors"].keys()))), **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
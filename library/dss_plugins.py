@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import time
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    get_client_from_parsed_args,
+    get_future_result,
+    get_plugin_source_fingerprint,
+    get_read_cache_from_parsed_args,
+    get_state_store_from_parsed_args,
+    merge,
+    plugin_has_code_env,
+    run_concurrently,
+    start_plugin_install,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_plugins
+
+short_description: Installs, updates and configures many plugins at once
+
+description:
+    - "This module lists the installed plugins once, then processes several plugins at a time: install or update,
+      creation of the code env and settings. The settings of each plugin are fetched once, merged and saved once."
+    - "Each plugin entry accepts the same keys as the dss_plugin module, and follows the same rules: the code env is
+      created whenever the installed plugin has one and its settings name none, and force updates from an unchanged
+      zip or git commit are skipped."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    plugins:
+        description:
+            - The list of plugins. Each item is a dictionary with the key "plugin_id" (mandatory), and any parameter of
+              the dss_plugin module such as "zip_file", "git_repository_url", "git_checkout", "git_subpath",
+              "settings", "force", "install_code_env" or "state".
+        required: true
+    concurrency:
+        description:
+            - Maximum number of plugins processed at the same time.
+        required: false
+        default: 4
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Install the plugins
+  dss_plugins:
+    api_key: XXX # It is required to use a personal API Key for plugins, global api key not accepted
+    host: XXX
+    port: "10000"
+    concurrency: 8
+    plugins:
+      - plugin_id: timeseries-preparation
+        settings:
+          detailsNotVisible: true
+      - plugin_id: geoadmin
+      - plugin_id: my-plugin
+        git_repository_url: "git@github.com:example/my-plugin.git"
+        git_checkout: v1.2.0
+        force: true
+      - plugin_id: old-plugin
+        state: absent
+"""
+
+RETURN = """
+plugins:
+    description: For each plugin id, its "message" (INSTALLED, UPDATED, MODIFIED, UNCHANGED or DELETED), "settings",
+        "job_results" and "timings" in seconds of the "install", "code_env" and "settings" steps
+    type: dict
+errors:
+    description: The error of every plugin that could not be processed, by plugin id
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+ALLOWED_PLUGIN_KEYS = set(
+    [
+        "plugin_id",
+        "zip_file",
+        "git_repository_url",
+        "git_checkout",
+        "git_subpath",
+        "settings",
+        "force",
+        "install_code_env",
+        "state",
+    ]
+)
+
+
+def process_plugin(client, state_store, read_cache, plugin_params, installed_plugin, check_mode):
+    plugin_id = plugin_params["plugin_id"]
+    plugin_result = {"message": "UNCHANGED", "job_results": [], "timings": {}}
+    start = time.time()
+    installed = installed_plugin is not None
+
+    if plugin_params["state"] == "absent":
+        if installed:
+            plugin_result["message"] = "DELETED"
+            if not check_mode:
+                future = client.get_plugin(plugin_id).delete(force=plugin_params["force"])
+                if future.job_id is not None:
+                    plugin_result["job_results"].append(get_future_result(future))
+                state_store.delete(plugin_id)
+        plugin_result["timings"]["total"] = time.time() - start
+        return plugin_result
+
+    # Install or update
+    source_fingerprint = get_plugin_source_fingerprint(
+        plugin_params["zip_file"],
+        plugin_params["git_repository_url"],
+        plugin_params["git_checkout"],
+        plugin_params["git_subpath"],
+    )
+    start_install = not installed
+    if not installed:
+        plugin_result["message"] = "INSTALLED"
+    elif plugin_params["force"] and (source_fingerprint is None or state_store.get(plugin_id) != source_fingerprint):
+        plugin_result["message"] = "UPDATED"
+        start_install = True
+    job_plugin_desc = {}
+    if start_install and not check_mode:
+        future = start_plugin_install(
+            client,
+            plugin_id,
+            installed,
+            plugin_params["zip_file"],
+            plugin_params["git_repository_url"],
+            plugin_params["git_checkout"],
+            plugin_params["git_subpath"],
+        )
+        plugin_result["job_results"].append(get_future_result(future))
+        job_plugin_desc = (plugin_result["job_results"][-1] or {}).get("pluginDesc", None) or {}
+        if source_fingerprint is not None:
+            state_store.set(plugin_id, source_fingerprint)
+        # Relist for the desc of the plugin as installed now
+        installed_plugin = dict((plugin["id"], plugin) for plugin in client.list_plugins()).get(plugin_id, None) or {}
+    plugin_result["timings"]["install"] = time.time() - start
+
+    if check_mode and not installed:
+        plugin_result["settings"] = plugin_params["settings"]
+        plugin_result["timings"]["total"] = time.time() - start
+        return plugin_result
+
+    # Single fetch of the settings, merged with the code env and the required settings
+    plugin = client.get_plugin(plugin_id)
+    settings_handle = plugin.get_settings()
+    current_settings = settings_handle.get_raw()
+    new_settings = merge(current_settings, plugin_params["settings"])
+
+    # The installed plugin tells whether it has a code env, also on the runs after its install
+    code_env_start = time.time()
+    if (
+        plugin_params["install_code_env"]
+        and (plugin_has_code_env(installed_plugin) or plugin_has_code_env(job_plugin_desc))
+        and "codeEnvName" not in new_settings
+    ):
+        if plugin_result["message"] == "UNCHANGED":
+            plugin_result["message"] = "MODIFIED"
+        if not check_mode:
+            code_env_install_result = get_future_result(plugin.create_code_env())
+            read_cache.invalidate("code_envs")
+            new_settings = merge(new_settings, {"codeEnvName": code_env_install_result.get("envName")})
+            plugin_result["job_results"].append(code_env_install_result)
+    plugin_result["timings"]["code_env"] = time.time() - code_env_start
+
+    settings_start = time.time()
+    if new_settings is not current_settings:
+        if plugin_result["message"] == "UNCHANGED":
+            plugin_result["message"] = "MODIFIED"
+        if not check_mode:
+            settings_handle.settings = new_settings
+            settings_handle.save()
+    plugin_result["settings"] = new_settings
+    plugin_result["timings"]["settings"] = time.time() - settings_start
+
+    plugin_result["timings"]["total"] = time.time() - start
+    return plugin_result
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        plugins=dict(type="list", required=True),
+        concurrency=dict(type="int", required=False, default=4),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    required_ids = set()
+    for plugin_params in args.plugins:
+        if not isinstance(plugin_params, dict) or plugin_params.get("plugin_id", None) is None:
+            module.fail_json(msg="Every item of 'plugins' must be a dictionary with at least a 'plugin_id' key")
+        plugin_id = plugin_params["plugin_id"]
+        if plugin_id in required_ids:
+            module.fail_json(msg="Plugin '{}' is listed more than once".format(plugin_id))
+        required_ids.add(plugin_id)
+        unknown_keys = set(plugin_params.keys()) - ALLOWED_PLUGIN_KEYS
+        if 0 < len(unknown_keys):
+            module.fail_json(msg="Unknown keys for plugin '{}': {}".format(plugin_id, ", ".join(sorted(unknown_keys))))
+        plugin_params.setdefault("state", "present")
+        plugin_params.setdefault("zip_file", None)
+        plugin_params.setdefault("git_repository_url", None)
+        plugin_params.setdefault("git_checkout", "master")
+        plugin_params.setdefault("git_subpath", None)
+        plugin_params.setdefault("settings", {})
+        plugin_params.setdefault("force", False)
+        plugin_params.setdefault("install_code_env", True)
+        if plugin_params["state"] not in ["present", "absent"]:
+            module.fail_json(
+                msg="Invalid value '{}' for state of plugin '{}' : must be either 'present' or 'absent'".format(
+                    plugin_params["state"], plugin_id
+                )
+            )
+
+    result = dict(changed=False, message="UNCHANGED", plugins={}, errors={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        state_store = get_state_store_from_parsed_args(module, "plugins")
+        read_cache = get_read_cache_from_parsed_args(module)
+        installed_plugins = dict((plugin["id"], plugin) for plugin in client.list_plugins())
+
+        def process(plugin_params):
+            plugin_id = plugin_params["plugin_id"]
+            try:
+                plugin_result = process_plugin(
+                    client,
+                    state_store,
+                    read_cache,
+                    plugin_params,
+                    installed_plugins.get(plugin_id, None),
+                    module.check_mode,
+                )
+                return plugin_id, plugin_result, None
+            except Exception as e:
+                return plugin_id, None, str(e)
+
+        for plugin_id, plugin_result, error in run_concurrently(process, args.plugins, args.concurrency):
+            if error is not None:
+                result["errors"][plugin_id] = error
+                continue
+            result["plugins"][plugin_id] = plugin_result
+            if plugin_result["message"] != "UNCHANGED":
+                result["changed"] = True
+
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+
+        if 0 < len(result["errors"]):
+            module.fail_json(
+                msg="Failed to process plugins: {}".format(", ".join(sorted(result["errors"].keys()))), **result
+            )
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
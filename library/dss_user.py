@@ -2,13 +2,18 @@
 
 from __future__ import absolute_import
 
-import copy
 import traceback
 
 import ansible.module_utils.dataiku_api_preload_imports
-import six
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.dataiku_utils import MakeNamespace, add_dss_connection_args, get_client_from_parsed_args
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    build_user_definition,
+    create_user_from_definition,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+)
 from ansible.module_utils.dataikuapi.dss.admin import DSSUser
 from ansible.module_utils.dataikuapi.utils import DataikuException
 from requests.exceptions import HTTPError
@@ -182,17 +187,28 @@ def run_module():
         user_exists = True
         create_user = False
         current_user = None
-        try:
-            current_user = user.get_definition()
-        except DataikuException as e:
-            if str(e).startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+        read_cache = get_read_cache_from_parsed_args(module)
+        if read_cache.enabled:
+            for listed_user in read_cache.get("users", client.list_users):
+                if listed_user["login"] == args.login:
+                    current_user = listed_user
+                    break
+            if current_user is None:
                 user_exists = False
                 if args.state == "present":
                     create_user = True
-            else:
+        else:
+            try:
+                current_user = user.get_definition()
+            except DataikuException as e:
+                if str(e).startswith("com.dataiku.dip.server.controllers.NotFoundException"):
+                    user_exists = False
+                    if args.state == "present":
+                        create_user = True
+                else:
+                    raise
+            except:
                 raise
-        except:
-            raise
 
         # Manage errors
         if args.source_type not in ["LOCAL", "LDAP", "LOCAL_NO_AUTH"]:
@@ -216,31 +232,12 @@ def run_module():
 
         # Build the new user definition
         # TODO: be careful that the key names changes between creation and edition
-        new_user_def = copy.deepcopy(current_user) if user_exists else {}  # Used for modification
-        result["previous_user_def"] = copy.deepcopy(new_user_def)
-        for key, api_param in [
-            ("email", "email"),
-            ("display_name", "displayName"),
-            ("profile", "userProfile"),
-            ("groups", "groups"),
-            ("source_type", "sourceType"),
-        ]:
-            if module.params.get(key, None) is not None:
-                value = module.params[key]
-                if isinstance(value, six.binary_type):
-                    value = value.decode("UTF-8")
-                new_user_def[key if create_user else api_param] = value
-        if user_exists and args.password is not None and not args.set_password_at_creation_only:
-            new_user_def["password"] = args.password
-
-        # Sort groups list before comparison as they should be considered sets
-        new_user_def.get("groups", []).sort()
-        if user_exists:
-            current_user.get("groups", []).sort()
+        result["previous_user_def"] = current_user if user_exists else {}
+        new_user_def = build_user_definition(module.params, current_user if user_exists else None)
 
         # Prepare the result for dry-run mode
         result["changed"] = (
-            create_user or (user_exists and args.state == "absent") or (user_exists and current_user != new_user_def)
+            create_user or (user_exists and args.state == "absent") or (user_exists and new_user_def is not current_user)
         )
         if result["changed"]:
             if create_user:
@@ -248,7 +245,7 @@ def run_module():
             elif user_exists:
                 if args.state == "absent":
                     result["message"] = "DELETED"
-                elif current_user != new_user_def:
+                elif new_user_def is not current_user:
                     result["message"] = "MODIFIED"
 
         # Can be useful to register info from a playbook and act on it
@@ -261,22 +258,13 @@ def run_module():
         # Apply the changes
         if result["changed"]:
             if create_user:
-                create_excluded_keys = ["email"]
-                create_excluded_values = {}
-                for create_excluded_key in create_excluded_keys:
-                    if new_user_def.get(create_excluded_key, None) is not None:
-                        create_excluded_values[create_excluded_key] = new_user_def[create_excluded_key]
-                        del new_user_def[create_excluded_key]
-                new_user = client.create_user(args.login, args.password, **new_user_def)
-                if module.params.get("email", None) is not None:
-                    new_user_def_mod = new_user.get_definition()
-                    new_user_def_mod.update(create_excluded_values)
-                    new_user.set_definition(new_user_def_mod)
+                create_user_from_definition(client, args.login, args.password, new_user_def)
             elif user_exists:
                 if args.state == "absent":
                     user.delete()
-                elif current_user != new_user_def:
+                elif new_user_def is not current_user:
                     result["message"] = str(user.set_definition(new_user_def))
+            read_cache.invalidate("users")
 
         module.exit_json(**result)
     except Exception as e:
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+from __future__ import absolute_import
+
+import traceback
+
+import ansible.module_utils.dataiku_api_preload_imports
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.dataiku_utils import (
+    MakeNamespace,
+    add_dss_connection_args,
+    build_user_definition,
+    create_user_from_definition,
+    get_client_from_parsed_args,
+    get_read_cache_from_parsed_args,
+)
+
+ANSIBLE_METADATA = {"metadata_version": "1.1", "status": ["preview"], "supported_by": "dataiku-ansible-modules"}
+
+DOCUMENTATION = """
+---
+module: dss_users
+
+short_description: Creates, edit or delete many Data Science Studio users at once
+
+description:
+    - "This module reconciles a list of users with the content of DSS. The current users are fetched with a single
+      listing call, the differences are computed in memory and only the required creations, modifications and
+      deletions are sent to DSS."
+    - "Each user entry accepts the same keys as the dss_user module."
+
+options:
+    connect_to:
+        description:
+            - A dictionary containing "port" and "api_key". This parameter is a short hand to be used with dss_get_credentials
+        required: true
+    host:
+        description:
+            - The host on which to make the requests.
+        required: false
+        default: localhost
+    port:
+        description:
+            - The port on which to make the requests.
+        required: false
+        default: 80
+    api_key:
+        description:
+            - The API Key to authenticate on the API. Mandatory if connect_to is not used
+        required: false
+    users:
+        description:
+            - The list of users. Each item is a dictionary with the keys "login" (mandatory), "password", "email",
+              "display_name", "groups", "profile", "source_type", "state" and "set_password_at_creation_only", with
+              the same meaning as the dss_user module parameters. The passwords are never logged.
+        required: true
+    set_password_at_creation_only:
+        description:
+            - Default value for the users not specifying it. See dss_user.
+        default: true
+        required: false
+    purge:
+        description:
+            - Delete the existing users that are not part of the "users" list.
+        default: false
+        required: false
+    purge_exclude:
+        description:
+            - Logins never deleted by "purge".
+        default: []
+        required: false
+
+author:
+    - Jean-Bernard Jansen (jean-bernard.jansen@dataiku.com)
+"""
+
+EXAMPLES = """
+- name: Get the API Key
+  become: true
+  become_user: dataiku
+  dss_get_credentials:
+    datadir: /home/dataiku/dss
+    api_key_name: myadminkey
+  register: dss_connection_info
+
+- name: Reconcile the users
+  become: true
+  become_user: dataiku
+  dss_users:
+    connect_to: "{{dss_connection_info}}"
+    purge: true
+    purge_exclude:
+      - admin
+    users:
+      - login: user1
+        display_name: Robert
+        password: Robert
+        groups:
+          - readers
+        profile: DATA_SCIENTIST
+      - login: user2
+        source_type: LDAP
+        groups:
+          - data_team
+      - login: user3
+        state: absent
+"""
+
+RETURN = """
+users:
+    description: For each login, CREATED, MODIFIED, UNCHANGED or DELETED
+    type: dict
+user_defs:
+    description: The new definitions of the created or modified users, by login
+    type: dict
+previous_user_defs:
+    description: The previous definitions of the modified or deleted users, by login
+    type: dict
+message:
+    description: MODIFIED or UNCHANGED
+    type: str
+"""
+
+
+def run_module():
+    # define the available arguments/parameters that a user can pass to
+    # the module
+    module_args = dict(
+        users=dict(
+            type="list",
+            required=True,
+            elements="dict",
+            options=dict(
+                login=dict(type="str", required=True),
+                password=dict(type="str", required=False, default=None, no_log=True),
+                set_password_at_creation_only=dict(type="bool", required=False, default=None, no_log=False),
+                email=dict(type="str", required=False, default=None),
+                display_name=dict(type="str", required=False, default=None),
+                groups=dict(type="list", required=False, default=None),
+                profile=dict(type="str", required=False, default=None),
+                source_type=dict(type="str", required=False, default="LOCAL"),
+                state=dict(type="str", required=False, default="present"),
+            ),
+        ),
+        set_password_at_creation_only=dict(type="bool", required=False, default=True, no_log=False),
+        purge=dict(type="bool", required=False, default=False),
+        purge_exclude=dict(type="list", required=False, default=[]),
+    )
+    add_dss_connection_args(module_args)
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    args = MakeNamespace(module.params)
+
+    # Manage errors
+    required_logins = set()
+    for user_params in args.users:
+        if user_params["login"] in required_logins:
+            module.fail_json(msg="User '{}' is listed more than once".format(user_params["login"]))
+        required_logins.add(user_params["login"])
+        if user_params["set_password_at_creation_only"] is None:
+            user_params["set_password_at_creation_only"] = args.set_password_at_creation_only
+        if user_params["state"] not in ["present", "absent"]:
+            module.fail_json(
+                msg="Invalid value '{}' for state of user '{}' : must be either 'present' or 'absent'".format(
+                    user_params["state"], user_params["login"]
+                )
+            )
+        if user_params["source_type"] not in ["LOCAL", "LDAP", "LOCAL_NO_AUTH"]:
+            module.fail_json(
+                msg="Invalid value '{}' for source_type of user '{}' : must be either 'LOCAL', 'LDAP' or 'LOCAL_NO_AUTH'".format(
+                    user_params["source_type"], user_params["login"]
+                )
+            )
+
+    result = dict(changed=False, message="UNCHANGED", users={}, user_defs={}, previous_user_defs={})
+
+    try:
+        client = get_client_from_parsed_args(module)
+        current_users = {}
+        read_cache = get_read_cache_from_parsed_args(module)
+        for current_user in read_cache.get("users", client.list_users):
+            current_users[current_user["login"]] = current_user
+
+        # Compute the deltas
+        to_create = []
+        to_modify = []
+        to_delete = []
+        for user_params in args.users:
+            login = user_params["login"]
+            current_user = current_users.get(login, None)
+            if user_params["state"] == "absent":
+                if current_user is not None:
+                    to_delete.append(login)
+                    result["users"][login] = "DELETED"
+                    result["previous_user_defs"][login] = current_user
+                else:
+                    result["users"][login] = "UNCHANGED"
+                continue
+
+            if current_user is None:
+                if user_params.get("password", None) is None and user_params["source_type"] not in ["LDAP", "LOCAL_NO_AUTH"]:
+                    module.fail_json(
+                        msg="The 'password' parameter is missing but is mandatory to create new local user '{}'.".format(
+                            login
+                        )
+                    )
+                if user_params.get("display_name", None) is None:
+                    user_params["display_name"] = login
+                if user_params.get("groups", None) is None:
+                    user_params["groups"] = ["readers"]
+                new_user_def = build_user_definition(user_params, None)
+                to_create.append((user_params, new_user_def))
+                result["users"][login] = "CREATED"
+                result["user_defs"][login] = new_user_def
+            else:
+                new_user_def = build_user_definition(user_params, current_user)
+                if new_user_def is not current_user:
+                    to_modify.append((login, new_user_def))
+                    result["users"][login] = "MODIFIED"
+                    result["user_defs"][login] = dict((k, v) for k, v in new_user_def.items() if k != "password")
+                    result["previous_user_defs"][login] = current_user
+                else:
+                    result["users"][login] = "UNCHANGED"
+
+        if args.purge:
+            for login, current_user in current_users.items():
+                if login not in required_logins and login not in args.purge_exclude:
+                    to_delete.append(login)
+                    result["users"][login] = "DELETED"
+                    result["previous_user_defs"][login] = current_user
+
+        # Prepare the result for dry-run mode
+        result["changed"] = 0 < len(to_create) + len(to_modify) + len(to_delete)
+        if result["changed"]:
+            result["message"] = "MODIFIED"
+
+        if module.check_mode:
+            module.exit_json(**result)
+
+        # Apply the changes
+        for user_params, new_user_def in to_create:
+            create_user_from_definition(client, user_params["login"], user_params.get("password", None), new_user_def)
+        for login, new_user_def in to_modify:
+            client.get_user(login).set_definition(new_user_def)
+        for login in to_delete:
+            client.get_user(login).delete()
+        if result["changed"]:
+            read_cache.invalidate("users")
+
+        module.exit_json(**result)
+    except Exception as e:
+        module.fail_json(msg="{}\n\n{}\n\n{}".format(str(e), traceback.format_exc(), "".join(traceback.format_stack())))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ errors with relative imports
 
 This is due to AnsiballZ and is not an issues with the api
 code
+
+Importing any dataikuapi submodule runs dataikuapi/__init__.py, which
+imports the DSS client, the API node clients and, through them, nearly
+every module listed here. A shorter list per module would not make the
+payload smaller, and would break on the Ansible versions that do not
+follow relative imports. See test/measure_module_payloads.py.
 """
 import ansible.module_utils.dataikuapi.apinode_admin.auth
 import ansible.module_utils.dataikuapi.apinode_admin.service
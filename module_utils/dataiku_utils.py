@@ -1,11 +1,35 @@
 from __future__ import absolute_import
 
-import collections
+import base64
+import copy
+import hashlib
+import hmac
+import json
 import logging
 import os
+import re
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
 
+import requests
 import six
+from ansible.module_utils.dataikuapi.dss.future import DSSFuture
 from ansible.module_utils.dataikuapi.dssclient import DSSClient
+from ansible.module_utils.dataikuapi.utils import DataikuException
+from ansible.module_utils.parsing.convert_bool import boolean
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlsplit
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 
 class MakeNamespace(object):
@@ -24,6 +48,127 @@ def add_dss_connection_args(module_args):
     )
 
 
+# Keyword arguments of get_client: (connect_to key, environment variable, default value)
+HTTP_SETTINGS = {
+    "use_https": ("use_https", "DATAIKU_ANSIBLE_DSS_USE_HTTPS", False),
+    "verify_tls": ("verify_tls", "DATAIKU_ANSIBLE_DSS_VERIFY_TLS", True),
+    "pool_size": ("pool_size", "DATAIKU_ANSIBLE_DSS_POOL_SIZE", 10),
+    "max_retries": ("max_retries", "DATAIKU_ANSIBLE_DSS_MAX_RETRIES", 2),
+    "connect_timeout": ("connect_timeout", "DATAIKU_ANSIBLE_DSS_CONNECT_TIMEOUT", 10),
+    "read_timeout": ("read_timeout", "DATAIKU_ANSIBLE_DSS_READ_TIMEOUT", None),
+}
+
+
+# requests.Session applying a default timeout to every request
+class DSSHTTPSession(requests.Session):
+    def __init__(self, timeout=None):
+        super(DSSHTTPSession, self).__init__()
+        self.timeout = timeout
+        self.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout", None) is None:
+            kwargs["timeout"] = self.timeout
+        return super(DSSHTTPSession, self).request(method, url, **kwargs)
+
+
+# requests.Session look-alike sending the requests through the Ansible persistent connection
+# of the dss httpapi plugin, used when the modules run on the controller
+class DSSPersistentConnectionSession(object):
+    def __init__(self, socket_path):
+        from ansible.module_utils.connection import Connection
+
+        self._connection = Connection(socket_path)
+        self.auth = None
+        self.headers = CaseInsensitiveDict()
+
+    def request(self, method, url, params=None, data=None, files=None, headers=None, stream=False, **kwargs):
+        request_headers = CaseInsensitiveDict(self.headers)
+        request_headers.update(headers or {})
+        prepared = requests.Request(
+            method, url, params=params, data=data, files=files, auth=self.auth, headers=request_headers
+        ).prepare()
+        body = prepared.body
+        if hasattr(body, "read"):
+            body = body.read()
+        if isinstance(body, six.text_type):
+            body = body.encode("UTF-8")
+        split_url = urlsplit(prepared.url)
+        path = split_url.path + ("?" + split_url.query if split_url.query else "")
+
+        raw_response = self._connection.send_request(
+            method,
+            path,
+            base64.b64encode(body).decode("ascii") if body is not None else None,
+            dict(prepared.headers),
+        )
+        response = requests.Response()
+        response.status_code = raw_response["status"]
+        response.reason = raw_response.get("reason", "")
+        response.headers = CaseInsensitiveDict(raw_response.get("headers", {}))
+        response.url = prepared.url
+        response.request = prepared
+        response._content = base64.b64decode(raw_response["body"])
+        response._content_consumed = True
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def _to_bool(value):
+    if isinstance(value, six.string_types):
+        return value.strip().lower() in ["1", "true", "yes", "on"]
+    return bool(value)
+
+
+def _to_optional_float(value):
+    if value is None or (isinstance(value, six.string_types) and value.strip().lower() in ["", "none", "null"]):
+        return None
+    return float(value)
+
+
+# Clients already built in this process, by (url, api_key, settings)
+_clients = {}
+
+
+# DSSClient whose HTTP session keeps its connections alive and pooled for all the calls made by a module
+def get_client(host, port, api_key, use_https=False, verify_tls=True, pool_size=10, max_retries=2, connect_timeout=10, read_timeout=None):
+    use_https = _to_bool(use_https)
+    if isinstance(verify_tls, six.string_types) and not os.path.exists(verify_tls):
+        verify_tls = _to_bool(verify_tls)
+    pool_size = int(pool_size)
+    max_retries = int(max_retries)
+    timeout = (_to_optional_float(connect_timeout), _to_optional_float(read_timeout))
+
+    url = "{}://{}:{}".format("https" if use_https else "http", host, port)
+    cache_key = (url, api_key, verify_tls, pool_size, max_retries, timeout)
+    if cache_key in _clients:
+        return _clients[cache_key]
+
+    client = DSSClient(url, api_key=api_key)
+    session = DSSHTTPSession(timeout=timeout)
+    session.auth = client._session.auth
+    session.verify = verify_tls
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    client._session = session
+    _clients[cache_key] = client
+    return client
+
+
+def get_port_from_parsed_args(args):
+    return (
+        args.port
+        if args.port is not None
+        else args.connect_to.get("port", os.environ.get("DATAIKU_ANSIBLE_DSS_PORT", "80"))
+    )
+
+
 def get_client_from_parsed_args(module):
     args = MakeNamespace(module.params)
     api_key = (
@@ -31,27 +176,1028 @@ def get_client_from_parsed_args(module):
         if args.api_key is not None
         else args.connect_to.get("api_key", os.environ.get("DATAIKU_ANSIBLE_DSS_API_KEY", None))
     )
+    socket_path = getattr(module, "_socket_path", None)
+    if api_key is None and socket_path is not None:
+        # The API Key of the persistent connection is used
+        api_key = ""
     if api_key is None:
         module.fail_json(
             msg="Missing an API Key, either from 'api_key' parameter, 'connect_to' parameter or DATAIKU_ANSIBLE_DSS_API_KEY env var".format(
                 args.state
             )
         )
-    port = (
-        args.port
-        if args.port is not None
-        else args.connect_to.get("port", os.environ.get("DATAIKU_ANSIBLE_DSS_PORT", "80"))
-    )
-    host = args.host
-    client = DSSClient("http://{}:{}".format(args.host, port), api_key=api_key)
+    port = get_port_from_parsed_args(args)
+    http_settings = {}
+    for setting, (connect_to_key, env_var, default) in HTTP_SETTINGS.items():
+        http_settings[setting] = args.connect_to.get(connect_to_key, os.environ.get(env_var, default))
+    if socket_path is not None:
+        client = DSSClient("http://{}:{}".format(args.host, port), api_key=api_key)
+        session = DSSPersistentConnectionSession(socket_path)
+        session.auth = client._session.auth if api_key else None
+        client._session = session
+        return client
+    try:
+        client = get_client(args.host, port, api_key, **http_settings)
+    except ValueError as e:
+        module.fail_json(msg="Invalid HTTP setting: {}".format(str(e)))
     return client
 
 
+# Snapshot of DSS listings stored on disk, by host and resource type, so that the tasks of a play
+# do not fetch again what an earlier task already fetched. Disabled if cache_dir is None.
+# Modules writing a resource must invalidate its resource type.
+class DSSReadCache(object):
+    def __init__(self, cache_dir, host_key, ttl):
+        self.cache_dir = cache_dir
+        self.host_key = hashlib.sha1(host_key.encode("UTF-8")).hexdigest()
+        self.ttl = float(ttl)
+
+    @property
+    def enabled(self):
+        return self.cache_dir is not None
+
+    def _path(self, resource_type):
+        return os.path.join(self.cache_dir, "{}-{}.json".format(self.host_key, resource_type))
+
+    def get(self, resource_type, loader):
+        if not self.enabled:
+            return loader()
+        path = self._path(resource_type)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                with open(path, "r") as cache_file:
+                    return json.load(cache_file)
+        except (OSError, IOError, ValueError):
+            pass
+        value = loader()
+        self.put(resource_type, value)
+        return value
+
+    def put(self, resource_type, value):
+        if not self.enabled:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, 0o700)
+        path = self._path(resource_type)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump(value, cache_file)
+        os.rename(tmp_path, path)
+
+    def invalidate(self, resource_type):
+        if not self.enabled:
+            return
+        try:
+            os.remove(self._path(resource_type))
+        except OSError:
+            pass
+
+
+def get_read_cache_from_parsed_args(module):
+    args = MakeNamespace(module.params)
+    cache_dir = args.connect_to.get("cache_dir", os.environ.get("DATAIKU_ANSIBLE_DSS_CACHE_DIR", None))
+    ttl = args.connect_to.get("cache_ttl", os.environ.get("DATAIKU_ANSIBLE_DSS_CACHE_TTL", 300))
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+    return DSSReadCache(cache_dir, "{}:{}".format(args.host, get_port_from_parsed_args(args)), ttl)
+
+
+# JSON document stored on the machine running the modules to remember what was last applied
+# to DSS, by host and name. Safe to use from several threads of a module.
+class DSSStateStore(object):
+    def __init__(self, state_dir, host_key, name):
+        self.path = os.path.join(
+            state_dir, "{}-{}.json".format(hashlib.sha1(host_key.encode("UTF-8")).hexdigest(), name)
+        )
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as state_file:
+                return json.load(state_file)
+        except (OSError, IOError, ValueError):
+            return {}
+
+    def _write(self, state):
+        state_dir = os.path.dirname(self.path)
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir, 0o700)
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as state_file:
+            json.dump(state, state_file, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._read().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            state = self._read()
+            state[key] = value
+            self._write(state)
+
+    def set_many(self, values):
+        with self._lock:
+            state = self._read()
+            state.update(values)
+            self._write(state)
+
+    def setdefault(self, key, value):
+        with self._lock:
+            state = self._read()
+            if key not in state:
+                state[key] = value
+                self._write(state)
+            return state[key]
+
+    def delete(self, key):
+        with self._lock:
+            state = self._read()
+            if key in state:
+                del state[key]
+                self._write(state)
+
+
+def get_state_store_from_parsed_args(module, name):
+    args = MakeNamespace(module.params)
+    state_dir = args.connect_to.get(
+        "state_dir", os.environ.get("DATAIKU_ANSIBLE_DSS_STATE_DIR", "~/.dataiku-ansible-modules")
+    )
+    return DSSStateStore(
+        os.path.expanduser(state_dir), "{}:{}".format(args.host, get_port_from_parsed_args(args)), name
+    )
+
+
+# Module parameter name -> key in the user definition returned by the API
+USER_KEYS_MAPPING = [
+    ("email", "email"),
+    ("display_name", "displayName"),
+    ("profile", "userProfile"),
+    ("groups", "groups"),
+    ("source_type", "sourceType"),
+]
+
+
+# Build the required user definition from module-like parameters.
+# If current_user is None, the keys are the ones expected by DSSClient.create_user
+def build_user_definition(params, current_user):
+    create = current_user is None
+    required_user_def = {}
+    for key, api_param in USER_KEYS_MAPPING:
+        if params.get(key, None) is not None:
+            value = params[key]
+            if isinstance(value, six.binary_type):
+                value = value.decode("UTF-8")
+            required_user_def[key if create else api_param] = value
+    if create:
+        return required_user_def
+    if params.get("password", None) is not None and not params.get("set_password_at_creation_only", True):
+        required_user_def["password"] = params["password"]
+
+    # Groups are compared as sets by merge, current_user is returned as is if nothing changed
+    return merge(current_user, required_user_def)
+
+
+# Create a user from a definition built by build_user_definition
+def create_user_from_definition(client, login, password, new_user_def):
+    create_excluded_keys = ["email"]
+    create_excluded_values = {}
+    create_def = dict(new_user_def)
+    for create_excluded_key in create_excluded_keys:
+        if create_def.get(create_excluded_key, None) is not None:
+            create_excluded_values[create_excluded_key] = create_def.pop(create_excluded_key)
+    new_user = client.create_user(login, password, **create_def)
+    if 0 < len(create_excluded_values):
+        new_user_def_mod = new_user.get_definition()
+        new_user_def_mod.update(create_excluded_values)
+        new_user.set_definition(new_user_def_mod)
+    return new_user
+
+
+# Group parameters and their camel case counterpart in the group definition
+GROUP_PARAMETERS = [
+    "description",
+    "source_type",
+    "admin",
+    "may_create_authenticated_connections",
+    "may_create_code_envs",
+    "may_create_clusters",
+    "may_create_projects",
+    "may_create_projects_from_macros",
+    "may_create_projects_from_templates",
+    "may_create_projects_from_dataiku_apps",
+    "may_create_published_API_services",
+    "may_create_published_projects",
+    "may_create_active_web_content",
+    "may_develop_plugins",
+    "may_edit_lib_folders",
+    "may_manage_code_envs",
+    "may_manage_clusters",
+    "may_manage_UDM",
+    "may_view_indexed_hive_connections",
+    "may_write_safe_code",
+    "may_write_unsafe_code",
+    "may_write_in_root_project_folder",
+    "can_obtain_API_ticket_from_cookies_for_groups_regex",
+]
+GROUP_KEYS_MAPPING = dict(
+    (key, re.sub(r"_[a-zA-Z]", lambda x: x.group()[1:].upper(), key)) for key in GROUP_PARAMETERS
+)
+
+
+# Transform group parameters to the camel case keys of the group definition
+def build_group_definition_args(params):
+    dict_args = {}
+    if params.get("ldap_group_names", None) is not None:
+        dict_args["ldapGroupNames"] = list(params["ldap_group_names"])
+    for key, camel_key in GROUP_KEYS_MAPPING.items():
+        value = params.get(key, None)
+        if value is not None:
+            dict_args[camel_key] = value
+    return dict_args
+
+
+# Fields of the connection params that DSS returns encrypted
+ENCRYPTED_FIELDS_LIST = ["password"]
+
+GENERIC_CONNECTION_TEMPLATE = {
+    "allowManagedDatasets": True,
+    "allowManagedFolders": False,
+    "allowWrite": True,
+    "allowedGroups": [],
+    # "creationTag": {},
+    # "credentialsMode": "GLOBAL",
+    "detailsReadability": {"allowedGroups": [], "readableBy": "NONE"},
+    # "indexingSettings": {
+    # "indexForeignKeys": False,
+    # "indexIndices": False,
+    # "indexSystemTables": False
+    # },
+    "maxActivities": 0,
+    # "name": "",
+    "params": {},
+    # "type": "PostgreSQL",
+    "usableBy": "ALL",
+    "useGlobalProxy": False,
+}
+
+CONNECTION_TEMPLATES = {
+    "PostgreSQL": {
+        "allowManagedDatasets": True,
+        "allowManagedFolders": False,
+        "allowWrite": True,
+        "allowedGroups": [],
+        # "creationTag": {},
+        "credentialsMode": "GLOBAL",
+        "detailsReadability": {"allowedGroups": [], "readableBy": "NONE"},
+        "indexingSettings": {"indexForeignKeys": False, "indexIndices": False, "indexSystemTables": False},
+        "maxActivities": 0,
+        # "name": "",
+        "params": {
+            "autocommitMode": False,
+            # "db": "",
+            # "host": "",
+            "namingRule": {
+                "canOverrideSchemaInManagedDatasetCreation": False,
+                "tableNameDatasetNamePrefix": "${projectKey}_",
+            },
+            # "password": "",
+            "port": 5432,
+            "properties": [],
+            "useTruncate": False,
+            "useURL": False,
+            # "user": ""
+        },
+        "type": "PostgreSQL",
+        "usableBy": "ALL",
+        "useGlobalProxy": False,
+    },
+}
+
+
+# Fresh copy of the template of a connection type, the generic one if there is no dedicated template
+def get_connection_template(connection_type):
+    template = copy.deepcopy(CONNECTION_TEMPLATES.get(connection_type, GENERIC_CONNECTION_TEMPLATE))
+    template["type"] = connection_type
+    return template
+
+
+# Split connection args into the args without the encrypted fields and the encrypted fields as {"params": {...}},
+# without modifying connection_args
+def split_encrypted_fields(connection_args):
+    params = connection_args.get("params", None) or {}
+    encrypted_fields = {
+        "params": dict((field, params[field]) for field in ENCRYPTED_FIELDS_LIST if params.get(field, None) is not None)
+    }
+    if not any(field in params for field in ENCRYPTED_FIELDS_LIST):
+        return connection_args, encrypted_fields
+    plain_args = dict(connection_args)
+    plain_args["params"] = dict((k, v) for k, v in params.items() if k not in ENCRYPTED_FIELDS_LIST)
+    return plain_args, encrypted_fields
+
+
+# HMAC-SHA256 of a secret, keyed by a random salt generated once per state file, so that the state
+# never holds a plain hash of a secret that could be looked up
+def get_secret_fingerprint(state_store, secret):
+    salt = state_store.setdefault("salt", base64.b64encode(os.urandom(32)).decode("ascii"))
+    if not isinstance(secret, six.binary_type):
+        secret = six.text_type(secret).encode("UTF-8")
+    return hmac.new(salt.encode("ascii"), secret, hashlib.sha256).hexdigest()
+
+
+def get_encrypted_field_state_key(connection_name, field):
+    return "{}/{}".format(connection_name, field)
+
+
+# Fingerprints of the encrypted fields {"params": {...}} of a connection, by state key
+def get_encrypted_fields_fingerprints(state_store, connection_name, encrypted_fields):
+    return dict(
+        (get_encrypted_field_state_key(connection_name, field), get_secret_fingerprint(state_store, value))
+        for field, value in encrypted_fields["params"].items()
+    )
+
+
+# Remove from encrypted_fields the fields whose fingerprint is the one recorded when they were last applied
+def skip_unchanged_encrypted_fields(state_store, connection_name, encrypted_fields, fingerprints):
+    for field in list(encrypted_fields["params"].keys()):
+        key = get_encrypted_field_state_key(connection_name, field)
+        if state_store.get(key) == fingerprints[key]:
+            del encrypted_fields["params"][field]
+
+
+def forget_encrypted_fields(state_store, connection_name):
+    for field in ENCRYPTED_FIELDS_LIST:
+        state_store.delete(get_encrypted_field_state_key(connection_name, field))
+
+
+# Remove the encrypted fields from a connection definition and return them as {"params": {...}}
+def pop_encrypted_fields(connection_def):
+    encrypted_fields = {"params": {}}
+    for field in ENCRYPTED_FIELDS_LIST:
+        value = connection_def.get("params", {}).pop(field, None)
+        if value is not None:
+            encrypted_fields["params"][field] = value
+    return encrypted_fields
+
+
+# Call function on every item with at most "concurrency" threads. Results are returned in the items order.
+def run_concurrently(function, items, concurrency):
+    items = list(items)
+    if concurrency is None or concurrency <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(min(concurrency, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# Result of a future. DSS sends no job id when the job finished before the response, the result is then already there
+def get_future_result(future):
+    if future.job_id is None:
+        return future.result_wrapper((future.state or {}).get("result", None))
+    return future.wait_for_result()
+
+
+# State of a job started by a previous run of a module, None if DSS no longer knows it
+def peek_future_state(client, job_id):
+    try:
+        return client.get_future(job_id).peek_state()
+    except DataikuException:
+        return None
+
+
+# Poll several DSS futures together. The polling interval grows by "backoff" while nothing
+# finishes and goes back to "initial_interval" as soon as a job finishes.
+# Returns {job_id: {"status": DONE|FAILED|TIMEOUT, "result": ..., "error": ..., "duration": seconds}}
+def wait_for_futures(
+    client, job_ids, timeout=None, initial_interval=1.0, max_interval=30.0, backoff=1.5, abort_on_timeout=False
+):
+    start = time.time()
+    results = {}
+    pending = list(job_ids)
+    interval = initial_interval
+    while 0 < len(pending):
+        still_pending = []
+        for job_id in pending:
+            try:
+                # Peek only, the module that started the job reads its result again when it runs next
+                state = client.get_future(job_id).peek_state()
+            except Exception as e:
+                results[job_id] = {"status": "FAILED", "result": None, "error": str(e), "duration": time.time() - start}
+                continue
+            if state.get("hasResult", False):
+                results[job_id] = {
+                    "status": "DONE",
+                    "result": state.get("result", None),
+                    "error": None,
+                    "duration": time.time() - start,
+                }
+            elif not state.get("alive", True):
+                results[job_id] = {
+                    "status": "FAILED",
+                    "result": None,
+                    "error": str(state.get("exception", "The job ended without result")),
+                    "duration": time.time() - start,
+                }
+            else:
+                still_pending.append(job_id)
+
+        if len(still_pending) < len(pending):
+            interval = initial_interval
+        else:
+            interval = min(interval * backoff, max_interval)
+        pending = still_pending
+        if 0 == len(pending):
+            break
+
+        elapsed = time.time() - start
+        if timeout is not None and timeout <= elapsed:
+            for job_id in pending:
+                if abort_on_timeout:
+                    client.get_future(job_id).abort()
+                results[job_id] = {"status": "TIMEOUT", "result": None, "error": "Timeout", "duration": elapsed}
+            break
+        time.sleep(interval if timeout is None else min(interval, timeout - elapsed))
+    return results
+
+
+# Lines of the pip output starting the download and install phases of a code env build
+CODE_ENV_BUILD_PHASE_MARKERS = [("download", "Downloading "), ("install", "Installing collected packages")]
+
+
+def _get_log_name(log):
+    return log["name"] if isinstance(log, dict) else log
+
+
+# Runs update_packages() of a code env in a thread, copying the new content of its logs into build_log while it runs.
+# On timeout, the running jobs of the code env are aborted as far as DSS lists them. Returns the time spent in each
+# phase of the build, as seen from the logs, with the precision of poll_interval.
+# Whether a job listed by DSS builds a code env, from the exact names in its payload
+def _is_code_env_job(future, lang, name):
+    payload = future.get("payload", None) or {}
+    return payload.get("envLang", None) == lang and payload.get("envName", None) == name
+
+
+def _list_running_job_ids(client):
+    return set(
+        future["jobId"]
+        for future in client.list_futures(as_objects=False, all_users=True)
+        if not future.get("hasResult", False)
+    )
+
+
+def update_code_env_packages(client, code_env, timeout=None, build_log=None, poll_interval=2.0):
+    start = time.time()
+    previous_logs = set(_get_log_name(log) for log in code_env.list_logs())
+    # update_packages() gives no job id, the job of the build is the one of this code env started after this point
+    previous_job_ids = None
+    if timeout is not None:
+        try:
+            previous_job_ids = _list_running_job_ids(client)
+        except Exception as e:
+            logging.warning("Could not list the jobs before the build of code env {}: {}".format(code_env.env_name, e))
+    read_lengths = {}
+    phase_starts = {"resolve": start}
+    outcome = {}
+
+    def build():
+        try:
+            code_env.update_packages()
+        except Exception as e:
+            outcome["error"] = e
+        outcome["end"] = time.time()
+
+    thread = threading.Thread(target=build)
+    thread.daemon = True
+    thread.start()
+
+    log_file = open(build_log, "a") if build_log is not None else None
+    try:
+        while True:
+            thread.join(poll_interval)
+            for log_name in sorted(_get_log_name(log) for log in code_env.list_logs()):
+                if log_name in previous_logs:
+                    continue
+                content = code_env.get_log(log_name)
+                new_content = content[read_lengths.get(log_name, 0) :]
+                read_lengths[log_name] = len(content)
+                for phase, marker in CODE_ENV_BUILD_PHASE_MARKERS:
+                    if phase not in phase_starts and marker in new_content:
+                        phase_starts[phase] = time.time()
+                if log_file is not None and 0 < len(new_content):
+                    log_file.write(new_content)
+                    log_file.flush()
+            if not thread.is_alive():
+                break
+            if timeout is not None and timeout <= time.time() - start:
+                aborted_job_ids = []
+                try:
+                    for future in client.list_futures(as_objects=False, all_users=True):
+                        if (
+                            not future.get("hasResult", False)
+                            and future["jobId"] not in (previous_job_ids or set())
+                            and _is_code_env_job(future, code_env.env_lang, code_env.env_name)
+                        ):
+                            client.get_future(future["jobId"]).abort()
+                            aborted_job_ids.append(future["jobId"])
+                except Exception as e:
+                    logging.warning("Could not abort the build of code env {}: {}".format(code_env.env_name, e))
+                raise Exception(
+                    "Build of code env {} timed out after {}s, aborted jobs: {}".format(
+                        code_env.env_name, timeout, ", ".join(aborted_job_ids) or "none"
+                    )
+                )
+    finally:
+        if log_file is not None:
+            log_file.close()
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    timings = {}
+    phases = [phase for phase in ["resolve", "download", "install"] if phase in phase_starts]
+    for phase, next_phase in zip(phases, phases[1:] + [None]):
+        timings[phase] = (phase_starts[next_phase] if next_phase is not None else outcome["end"]) - phase_starts[phase]
+    timings["total"] = outcome["end"] - start
+    return timings
+
+
+# Streamed multipart/form-data body holding a single file, read from the disk as it is sent
+# instead of being loaded in memory
+class MultipartFileStream(object):
+    def __init__(self, path, field_name="file", content_type="application/octet-stream"):
+        boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary={}".format(boundary)
+        head = (
+            '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\nContent-Type: {}\r\n\r\n'.format(
+                boundary, field_name, os.path.basename(path), content_type
+            )
+        ).encode("UTF-8")
+        tail = "\r\n--{}--\r\n".format(boundary).encode("UTF-8")
+        self._length = len(head) + os.path.getsize(path) + len(tail)
+        self._parts = [head, open(path, "rb"), tail]
+        self._offset = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        remaining = size
+        while 0 < len(self._parts) and (size < 0 or 0 < remaining):
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                end = len(part) if size < 0 else self._offset + remaining
+                data = part[self._offset : end]
+                self._offset += len(data)
+                if len(part) <= self._offset:
+                    self._parts.pop(0)
+                    self._offset = 0
+            else:
+                data = part.read(size if size < 0 else remaining)
+                if size < 0 or len(data) < remaining:
+                    part.close()
+                    self._parts.pop(0)
+            chunks.append(data)
+            remaining -= len(data)
+        return b"".join(chunks)
+
+    def close(self):
+        for part in self._parts:
+            if not isinstance(part, bytes):
+                part.close()
+        self._parts = []
+
+
+# POSTs a file to a public API endpoint starting a DSS job, streaming it from the disk
+def post_file_for_future(client, path, file_path):
+    stream = MultipartFileStream(file_path, content_type="application/zip")
+    try:
+        response = client._session.request(
+            "POST",
+            "{}/dip/publicapi{}".format(client.host, path),
+            data=stream,
+            headers={"Content-Type": stream.content_type},
+        )
+    finally:
+        stream.close()
+    if response.status_code < 200 or 400 <= response.status_code:
+        try:
+            error = response.json()
+        except ValueError:
+            error = {"message": response.text}
+        raise DataikuException(
+            "%s: %s" % (error.get("errorType", "Unknown error"), error.get("message", "No message"))
+        )
+    return DSSFuture.from_resp(client, response.json())
+
+
+def install_plugin_from_zip_file(client, zip_path):
+    return post_file_for_future(client, "/plugins/actions/installFromZip", zip_path)
+
+
+def update_plugin_from_zip_file(client, plugin_id, zip_path):
+    return post_file_for_future(client, "/plugins/{}/actions/updateFromZip".format(plugin_id), zip_path)
+
+
+# Starts the install of a plugin, or its update if it is already installed, from a zip file, a git repository or
+# the store
+def start_plugin_install(
+    client, plugin_id, installed, zip_file=None, git_repository_url=None, git_checkout="master", git_subpath=None
+):
+    if not installed:
+        if zip_file is not None:
+            return install_plugin_from_zip_file(client, zip_file)
+        if git_repository_url is not None:
+            return client.install_plugin_from_git(git_repository_url, git_checkout, git_subpath)
+        return client.install_plugin_from_store(plugin_id)
+    if zip_file is not None:
+        return update_plugin_from_zip_file(client, plugin_id, zip_file)
+    if git_repository_url is not None:
+        return client.get_plugin(plugin_id).update_from_git(git_repository_url, git_checkout, git_subpath)
+    return client.get_plugin(plugin_id).update_from_store()
+
+
+def get_file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Commit a git branch, tag or commit points to in a remote repository, None if it cannot be resolved
+def resolve_git_commit(repository_url, checkout):
+    if re.match(r"^[0-9a-f]{40}$", checkout):
+        return checkout
+    try:
+        output = subprocess.check_output(["git", "ls-remote", repository_url, checkout])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    refs = {}
+    for line in output.decode("UTF-8").splitlines():
+        commit, ref = line.split("\t", 1)
+        refs[ref] = commit
+    for ref in ["refs/tags/{}^{{}}", "refs/tags/{}", "refs/heads/{}", "{}"]:
+        if ref.format(checkout) in refs:
+            return refs[ref.format(checkout)]
+    return None
+
+
+# Key of the job a module started on a plugin without waiting for it, in the "plugins" state store
+def get_plugin_pending_job_key(plugin_id):
+    return "{}/pending_job".format(plugin_id)
+
+
+# Whether a plugin ships a code env, from its desc as listed by DSS or as returned by its install job
+def plugin_has_code_env(plugin_desc):
+    return "codeEnvSpec" in plugin_desc or "codeEnvSpec" in (plugin_desc.get("desc", None) or {})
+
+
+# Fingerprint of the content of the source of a plugin, None for the store or if it cannot be resolved
+def get_plugin_source_fingerprint(zip_file=None, git_repository_url=None, git_checkout="master", git_subpath=None):
+    if zip_file is not None:
+        return "zip:{}".format(get_file_sha256(zip_file))
+    if git_repository_url is not None:
+        commit = resolve_git_commit(git_repository_url, git_checkout)
+        if commit is not None:
+            return "git:{}@{}:{}".format(git_repository_url, commit, git_subpath or "")
+    return None
+
+
+# Fingerprint of what decides the content of a built code env: packages, interpreter, core packages
+# and jupyter flags, and version on automation nodes
+def get_code_env_spec_fingerprint(code_env_def, version=None):
+    versioned_def = code_env_def.get(version, {}) if version is not None else code_env_def
+    desc = versioned_def.get("desc", {})
+    spec = {
+        "version": version,
+        "specPackageList": versioned_def.get("specPackageList", None),
+        "specCondaEnvironment": versioned_def.get("specCondaEnvironment", None),
+        "pythonInterpreter": desc.get("pythonInterpreter", versioned_def.get("pythonInterpreter", None)),
+        "installCorePackages": desc.get("installCorePackages", None),
+        "installJupyterSupport": desc.get("installJupyterSupport", None),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("UTF-8")).hexdigest()
+
+
+# Pip options making a python code env install its packages from a wheelhouse directory or a local index
+def get_package_source_options(package_source):
+    if package_source is None:
+        return []
+    if "://" in package_source:
+        return ["--index-url {}".format(package_source)]
+    return ["--no-index", "--find-links {}".format(package_source)]
+
+
+# Required code env definition from dss_code_env parameters, with its part specific to the version on
+# automation nodes (the whole definition otherwise)
+def build_code_env_definition(params):
+    required_code_env_def = {}
+    versioned_required_code_env_def = required_code_env_def
+    if params.get("version", None) is not None:
+        required_code_env_def[params["version"]] = {"desc": {}}
+        versioned_required_code_env_def = required_code_env_def[params["version"]]
+    else:
+        required_code_env_def["desc"] = {}
+    if params.get("permissions", None) is not None:
+        required_code_env_def["permissions"] = params["permissions"]
+    if params.get("usable_by_all", None) is not None:
+        required_code_env_def["usableByAll"] = params["usable_by_all"]
+    if params.get("conda_environment", None) is not None:
+        versioned_required_code_env_def["specCondaEnvironment"] = params["conda_environment"]
+    if params.get("package_list", None) is not None:
+        versioned_required_code_env_def["specPackageList"] = "\n".join(
+            get_package_source_options(params.get("package_source", None)) + params["package_list"]
+        )
+    if params.get("external_conda_env_name", None) is not None:
+        versioned_required_code_env_def["externalCondaEnvName"] = params["external_conda_env_name"]
+    if params.get("owner", None) is not None:
+        if params.get("deployment_mode", None) in ["DESIGN_MANAGED", "DESIGN_MANAGED", "PLUGIN_MANAGED", "PLUGIN_NON_MANAGED"]:
+            versioned_required_code_env_def["desc"]["owner"] = params["owner"]
+        else:
+            versioned_required_code_env_def["owner"] = params["owner"]
+    if params.get("desc", None) is not None:
+        update(versioned_required_code_env_def["desc"], params["desc"])
+
+    core_packages = params.get("core_packages", True)
+    if core_packages and "installCorePackages" not in versioned_required_code_env_def["desc"]:
+        versioned_required_code_env_def["desc"]["installCorePackages"] = core_packages
+
+    jupyter_support = params.get("jupyter_support", True)
+    if jupyter_support and "installJupyterSupport" not in versioned_required_code_env_def["desc"]:
+        versioned_required_code_env_def["desc"]["installJupyterSupport"] = jupyter_support
+
+    return required_code_env_def, versioned_required_code_env_def
+
+
+# Whether the package list or the jupyter support of an existing code env is modified by the required definition
+def code_env_packages_changed(code_env_def, versioned_required_code_env_def, version=None):
+    current_def = code_env_def.get(version, {}) if version is not None else code_env_def
+    if "specPackageList" in versioned_required_code_env_def and "specPackageList" in current_def:
+        if versioned_required_code_env_def["specPackageList"] != current_def["specPackageList"]:
+            return True
+    required_desc = versioned_required_code_env_def.get("desc", {})
+    current_desc = current_def.get("desc", {})
+    if "installJupyterSupport" in required_desc and "installJupyterSupport" in current_desc:
+        if required_desc["installJupyterSupport"] != current_desc["installJupyterSupport"]:
+            return True
+    return False
+
+
+# Directory of a code env in the datadir, with one sub-directory per version on automation nodes
+def get_code_env_path(datadir, lang, name, version=None):
+    env_path = os.path.join(datadir, "code-envs", "python" if lang == "PYTHON" else "R", name)
+    if version is not None:
+        env_path = os.path.join(env_path, "versions", version)
+    return env_path
+
+
+# Creation time of a code env version, None when its definition does not tell
+def _get_code_env_version_timestamp(version_def):
+    return ((version_def or {}).get("creationTag", None) or {}).get("lastModifiedOn", None)
+
+
+# Versions of a code env on automation nodes, from oldest to newest. DSS 9 lists them in "versions" as dicts with a
+# "versionId", older versions keep them as sub-definitions keyed by the version name. The creation timestamps order
+# them when every version has one, then the order of "versions", then the natural order of the names
+def get_code_env_versions(code_env_def):
+    versions = []
+    timestamps = {}
+    for version in code_env_def.get("versions", None) or []:
+        if isinstance(version, dict) and version.get("versionId", None) not in [None] + versions:
+            versions.append(version["versionId"])
+            timestamps[version["versionId"]] = _get_code_env_version_timestamp(version)
+    sub_definitions = dict(
+        (key, value) for key, value in code_env_def.items() if isinstance(value, dict) and "desc" in value
+    )
+    versions += sorted(
+        [version for version in sub_definitions if version not in versions],
+        key=lambda version: [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)],
+    )
+    for version, version_def in sub_definitions.items():
+        if timestamps.get(version, None) is None:
+            timestamps[version] = _get_code_env_version_timestamp(version_def)
+    if all(timestamps.get(version, None) is not None for version in versions):
+        versions.sort(key=lambda version: timestamps[version])
+    return versions
+
+
+# Copy of a code env definition without some of its versions, in both layouts of get_code_env_versions
+def remove_code_env_versions(code_env_def, versions):
+    new_def = dict((key, value) for key, value in code_env_def.items() if key not in versions)
+    if isinstance(code_env_def.get("versions", None), list):
+        new_def["versions"] = [
+            version
+            for version in code_env_def["versions"]
+            if not isinstance(version, dict) or version.get("versionId", None) not in versions
+        ]
+    return new_def
+
+
+# Usages of a code env, or of one of its versions. The code env handle of clients older than DSS 9 cannot list them
+def list_code_env_usages(client, lang, name, version=None):
+    code_env = client.get_code_env(lang, name)
+    if hasattr(code_env, "list_usages"):
+        return code_env.list_usages(env_version=version)
+    return client._perform_json(
+        "GET", "/admin/code-envs/{}/{}/usages".format(lang, name), params={"envVersion": version}
+    )
+
+
+# Size in bytes of the files under a directory, without following links
+def get_directory_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                size += os.lstat(os.path.join(root, file_name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+CODE_ENV_ARTIFACT_MANIFEST = "dss-code-env-manifest.json"
+
+
+# Tarball of a built code env directory, with a manifest holding the fingerprint of its spec
+def export_code_env_artifact(env_path, dest, manifest):
+    tmp_dest = "{}.{}.tmp".format(dest, os.getpid())
+
+    # Links of virtualenvs to the system interpreter are left out of the archive and recreated at import, so that
+    # every link of the archive stays in the env
+    external_links = {}
+
+    def exclude_external_link(tarinfo):
+        if tarinfo.issym():
+            target = os.path.normpath(os.path.join(os.path.dirname(tarinfo.name), tarinfo.linkname))
+            if os.path.isabs(tarinfo.linkname) or not (target == "env" or target.startswith("env/")):
+                external_links[tarinfo.name] = tarinfo.linkname
+                return None
+        return tarinfo
+
+    with tarfile.open(tmp_dest, "w:gz") as artifact:
+        artifact.add(env_path, arcname="env", filter=exclude_external_link)
+        manifest = dict(manifest, external_links=external_links)
+        manifest_data = json.dumps(manifest, indent=2, sort_keys=True).encode("UTF-8")
+        manifest_info = tarfile.TarInfo(CODE_ENV_ARTIFACT_MANIFEST)
+        manifest_info.size = len(manifest_data)
+        manifest_info.mtime = time.time()
+        artifact.addfile(manifest_info, six.BytesIO(manifest_data))
+    os.rename(tmp_dest, dest)
+
+
+def read_code_env_artifact_manifest(path):
+    with tarfile.open(path, "r:*") as artifact:
+        return json.loads(artifact.extractfile(CODE_ENV_ARTIFACT_MANIFEST).read().decode("UTF-8"))
+
+
+# Whether a path is a directory or is under it, once the links on the way are resolved
+def _is_within(path, directory):
+    path = os.path.realpath(path)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+# Path of a member of a code env artifact in the extraction directory, which it must not leave, even through
+# the links already extracted
+def _get_artifact_member_path(name, tmp_path, tmp_root, artifact_path):
+    if not (name == "env" or name.startswith("env/")) or ".." in name.split("/"):
+        raise Exception("Unexpected path '{}' in code env artifact '{}'".format(name, artifact_path))
+    member_path = os.path.join(tmp_path, name)
+    if not _is_within(os.path.dirname(member_path), tmp_root):
+        raise Exception("Unexpected path '{}' in code env artifact '{}'".format(name, artifact_path))
+    return member_path
+
+
+# Replaces the content of the code env directory by the one of the artifact
+def import_code_env_artifact(path, env_path):
+    tmp_path = "{}.import-{}".format(env_path.rstrip(os.sep), os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    tmp_root = os.path.realpath(tmp_path)
+    # Python versions with extraction filters warn without one, the members are checked here already
+    extract_args = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+    try:
+        with tarfile.open(path, "r:*") as artifact:
+            external_links = {}
+            for member in artifact.getmembers():
+                if member.name == CODE_ENV_ARTIFACT_MANIFEST:
+                    external_links = json.loads(artifact.extractfile(member).read().decode("UTF-8")).get(
+                        "external_links", {}
+                    )
+                    continue
+                member_path = _get_artifact_member_path(member.name, tmp_path, tmp_root, path)
+                # Links must resolve in the env, hard links from the root of the archive
+                link_target = None
+                if member.issym():
+                    link_target = os.path.join(os.path.dirname(member_path), member.linkname)
+                elif member.islnk():
+                    link_target = os.path.join(tmp_path, member.linkname)
+                if link_target is not None and not _is_within(link_target, tmp_root):
+                    raise Exception("Unexpected link '{}' in code env artifact '{}'".format(member.name, path))
+                artifact.extract(member, tmp_path, **extract_args)
+        # Nothing else is extracted once the links to the system interpreter are there
+        for name, target in sorted(external_links.items()):
+            member_path = _get_artifact_member_path(name, tmp_path, tmp_root, path)
+            if os.path.lexists(member_path):
+                raise Exception("Unexpected link '{}' in code env artifact '{}'".format(name, path))
+            os.symlink(target, member_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    old_path = "{}.old-{}".format(env_path.rstrip(os.sep), os.getpid())
+    if os.path.exists(env_path):
+        os.rename(env_path, old_path)
+    os.rename(os.path.join(tmp_path, "env"), env_path)
+    shutil.rmtree(tmp_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+# Imports the artifact only if it was built from the same spec at the same path, says why otherwise
+def import_code_env_artifact_if_matching(path, env_path, fingerprint):
+    manifest = read_code_env_artifact_manifest(path)
+    if manifest.get("spec_fingerprint", None) != fingerprint:
+        return False, "artifact fingerprint does not match"
+    if manifest.get("env_path", None) != env_path:
+        return False, "artifact built for another path ({})".format(manifest.get("env_path", None))
+    import_code_env_artifact(path, env_path)
+    return True, "imported from artifact"
+
+
+# Lockfile of a code env: the exact packages installed by a build of a given spec, keyed by the fingerprint
+# of that spec as required by the module
+def read_code_env_lockfile(path):
+    try:
+        with open(path, "r") as lockfile:
+            return json.load(lockfile)
+    except (OSError, IOError, ValueError):
+        return None
+
+
+def write_code_env_lockfile(path, lock):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as lockfile:
+        json.dump(lock, lockfile, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+# Spec pinning the packages actually installed by the last build of a code env, keeping the pip options
+# of the package source
+def get_code_env_pinned_spec(code_env_def, version=None, package_source=None):
+    versioned_def = code_env_def.get(version, {}) if version is not None else code_env_def
+    pinned_spec = {}
+    if versioned_def.get("actualPackageList", None):
+        pinned_spec["specPackageList"] = "\n".join(
+            get_package_source_options(package_source) + [versioned_def["actualPackageList"]]
+        )
+    if versioned_def.get("actualCondaEnvironment", None):
+        pinned_spec["specCondaEnvironment"] = versioned_def["actualCondaEnvironment"]
+    return pinned_spec
+
+
+# The update parameter of the code env modules is either a boolean, from YAML or as a string, or "auto"
+def parse_code_env_update(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, six.string_types) and value.strip().lower() == "auto":
+        return "auto"
+    return boolean(value.strip() if isinstance(value, six.string_types) else value)
+
+
+def get_code_env_state_key(lang, name, version=None):
+    return "{}/{}/{}".format(lang, name, version or "")
+
+
+# Whether to run update_packages() on a code env, and why
+def get_code_env_update_reason(update, deployment_mode, create, packages_changed, previous_fingerprint, fingerprint):
+    if deployment_mode is not None and "NON_MANAGED" in deployment_mode:
+        return False, "code env not managed by DSS"
+    if create:
+        return True, "code env created"
+    if update is True:
+        return True, "update is true"
+    if packages_changed:
+        return True, "package list or jupyter support changed"
+    if update == "auto":
+        if previous_fingerprint is None:
+            return True, "no fingerprint recorded for the last build"
+        if previous_fingerprint != fingerprint:
+            return True, "spec fingerprint changed since the last build"
+        return False, "spec fingerprint unchanged since the last build"
+    return False, "update is false"
+
+
 # Similar to dict.update but deep
 def update(d, u):
-    if isinstance(d, collections.Mapping):
+    if isinstance(d, Mapping):
         for k, v in six.iteritems(u):
-            if isinstance(v, collections.Mapping):
+            if isinstance(v, Mapping):
                 d[k] = update(d.get(k, {}), v)
             else:
                 d[k] = v
@@ -61,13 +1207,65 @@ def update(d, u):
 
 
 def extract_keys(input_data, keys_reference):
-    if isinstance(input_data, collections.Mapping):
+    if isinstance(input_data, Mapping):
         extracted_data = {}
         for k, v in keys_reference.items():
-            if isinstance(v, collections.Mapping):
+            if isinstance(v, Mapping):
                 extracted_data[k] = extract_keys(input_data.get(k,{}), v)
             else:
                 extracted_data[k] = input_data.get(k, None)
     else:
         extracted_data = input_data
     return extracted_data
+
+
+# Keys whose list values are compared as sets: their order is not significant for DSS
+SET_LIST_KEYS = frozenset(["groups", "allowedGroups", "ldapGroupNames"])
+
+
+def _same_value(key, current, required):
+    if key in SET_LIST_KEYS and isinstance(required, list) and isinstance(current, (list, type(None))):
+        try:
+            return set(current or []) == set(required)
+        except TypeError:
+            pass
+    return current == required
+
+
+def _merge(base, overlay, path, changes):
+    if not isinstance(base, Mapping):
+        if base != overlay:
+            changes.append((path, base, overlay))
+        return overlay
+    merged = base
+    for k, v in six.iteritems(overlay):
+        current = base.get(k, None)
+        if isinstance(v, Mapping):
+            changes_count = len(changes)
+            new = _merge(current if current is not None else {}, v, path + [k], changes)
+            if new is not current and changes_count == len(changes):
+                changes.append((path + [k], current, new))
+        elif _same_value(k, current, v):
+            continue
+        else:
+            new = v
+            changes.append((path + [k], current, v))
+        if new is not current:
+            if merged is base:
+                merged = dict(base)
+            merged[k] = new
+    return merged
+
+
+# Deep merge of overlay onto base, as update does, without modifying nor copying base: only the dicts on the
+# path of a change are copied, everything else is shared with base. Returns the merged data, which is base
+# itself if nothing changed, and the changes as (path, previous value, new value), a missing key being None.
+# The lists of SET_LIST_KEYS are compared regardless of order
+def merge_changes(base, overlay):
+    changes = []
+    merged = _merge(base, overlay, [], changes)
+    return merged, changes
+
+
+def merge(base, overlay):
+    return merge_changes(base, overlay)[0]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Compares, on a large settings document, the merge of the required settings the
+modules did before, a deep copy of the current settings updated in place then
+compared with them, with merge_changes of dataiku_utils, which only copies the
+dicts on the path of a change.
+
+The dataiku_utils module and the dataikuapi package it imports are looked up in
+the module_utils search path of Ansible, so it must contain both this role and
+the dataikuapi package:
+
+    ANSIBLE_MODULE_UTILS=module_utils:/path/to/roles/dataiku-api-client-python/module_utils \\
+        python test/benchmark_merge.py --entries 2000
+
+Time is the best of the runs, memory is the peak allocated during one merge
+(Python 3 only).
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import copy
+import json
+import os
+import timeit
+
+import ansible.module_utils
+
+ansible.module_utils.__path__.extend(os.environ.get("ANSIBLE_MODULE_UTILS", "module_utils").split(os.pathsep))
+
+from ansible.module_utils.dataiku_utils import merge_changes, update  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# A document shaped like the general settings: many entries with nested params and groups lists
+def build_settings(entries):
+    return {
+        "connections": dict(
+            (
+                "connection_{}".format(i),
+                {
+                    "type": "PostgreSQL",
+                    "allowWrite": True,
+                    "allowedGroups": ["group_{}".format(j) for j in range(i % 7, i % 7 + 5)],
+                    "detailsReadability": {"allowedGroups": [], "readableBy": "NONE"},
+                    "params": {
+                        "host": "db-{}.example.com".format(i),
+                        "port": 5432,
+                        "db": "db_{}".format(i),
+                        "properties": [{"name": "prop_{}".format(j), "value": str(j)} for j in range(5)],
+                    },
+                },
+            )
+            for i in range(entries)
+        ),
+        "ldapSettings": {"enabled": True, "url": "ldap://ldap.example.com", "groupProfiles": []},
+        "maxRunningActivities": 5,
+    }
+
+
+# A few changed values, the same groups in another order and many unchanged values
+def build_overlay(entries):
+    overlay = {"maxRunningActivities": 10, "ldapSettings": {"enabled": True}, "connections": {}}
+    for n, i in enumerate(range(0, entries, max(1, entries // 20))):
+        overlay["connections"]["connection_{}".format(i)] = {
+            "allowWrite": True,
+            "allowedGroups": list(reversed(["group_{}".format(j) for j in range(i % 7, i % 7 + 5)])),
+            "params": {"port": 5433 if n % 2 else 5432},
+        }
+    return overlay
+
+
+def merge_with_deepcopy(base, overlay):
+    new = copy.deepcopy(base)
+    update(new, overlay)
+    return new, new != base
+
+
+def merge_copy_on_write(base, overlay):
+    new, changes = merge_changes(base, overlay)
+    return new, new is not base
+
+
+def peak_memory(function, base, overlay):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    function(base, overlay)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000, help="Number of connections in the document")
+    parser.add_argument("--runs", type=int, default=20, help="Runs of each merge")
+    args = parser.parse_args()
+
+    base = build_settings(args.entries)
+    overlay = build_overlay(args.entries)
+    print("Document of {} bytes as JSON, overlay of {} bytes".format(len(json.dumps(base)), len(json.dumps(overlay))))
+    print("{:<16} {:>12} {:>16}".format("merge", "time (ms)", "peak memory (B)"))
+    for name, function in [("deepcopy+update", merge_with_deepcopy), ("merge_changes", merge_copy_on_write)]:
+        best = min(timeit.repeat(lambda: function(base, overlay), number=1, repeat=args.runs))
+        peak = peak_memory(function, base, overlay)
+        print("{:<16} {:>12.2f} {:>16}".format(name, best * 1000, peak if peak is not None else "n/a"))
+
+
+if __name__ == "__main__":
+    main()
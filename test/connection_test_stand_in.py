@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Runs the dss_connection_test module against a local HTTP server standing in for
+the DSS API, with many SQL and HDFS connections answering after a random delay,
+some of them failing, and prints the result of the module.
+
+The module is built with the module_utils search path of Ansible, so it must
+contain both this role and the dataikuapi package:
+
+    ANSIBLE_MODULE_UTILS=module_utils:/path/to/roles/dataiku-api-client-python/module_utils \\
+        python test/connection_test_stand_in.py --connections 150 --failing 5 --concurrency 16
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from ansible.executor.module_common import modify_module
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+from six.moves import BaseHTTPServer, socketserver
+
+
+class DSSStandIn(BaseHTTPServer.BaseHTTPRequestHandler):
+    connections = {}
+    failing = set()
+    max_delay = 0.0
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _test(self, name):
+        time.sleep(random.uniform(0, DSSStandIn.max_delay))
+        if name in DSSStandIn.failing:
+            error = {"errorType": "java.sql.SQLException", "message": "Connection refused to '{}'".format(name)}
+            self._send(500, error)
+            return False
+        return True
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/dip/publicapi/admin/connections/":
+            self._send(200, DSSStandIn.connections)
+        elif re.match(r"^/dip/publicapi/connections/[^/]+/info$", path):
+            if self._test(path.split("/")[-2]):
+                self._send(200, {"name": path.split("/")[-2]})
+        elif path.endswith("/stream"):
+            self._send(200, b"1\n", "text/tab-separated-values")
+        elif path.endswith("/finish-streaming"):
+            self._send(204, b"")
+        else:
+            self._send(404, {"errorType": "NotFoundException", "message": path})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("UTF-8"))
+        if self.path != "/dip/publicapi/sql/queries/":
+            self._send(404, {"errorType": "NotFoundException", "message": self.path})
+        elif self._test(body["connection"]):
+            self._send(200, {"queryId": str(uuid.uuid4()), "schema": [{"name": "1", "type": "int"}]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", default=os.path.join(os.path.dirname(__file__), "..", "library"))
+    parser.add_argument("--connections", type=int, default=150, help="Number of connections, half SQL, half HDFS")
+    parser.add_argument("--failing", type=int, default=5, help="Number of failing connections")
+    parser.add_argument("--max-delay", type=float, default=0.2, help="Maximum delay of a test in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    DSSStandIn.connections = dict(
+        (
+            "connection_{}".format(i),
+            {"name": "connection_{}".format(i), "type": "PostgreSQL" if i % 2 else "HDFS", "params": {}},
+        )
+        for i in range(args.connections)
+    )
+    DSSStandIn.failing = set(random.sample(sorted(DSSStandIn.connections.keys()), args.failing))
+    DSSStandIn.max_delay = args.max_delay
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DSSStandIn)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    module_args = {
+        "host": "127.0.0.1",
+        "port": str(server.server_address[1]),
+        "api_key": "stand-in",
+        "concurrency": args.concurrency,
+        "max_failure_rate": args.max_failure_rate,
+    }
+    module_path = os.path.join(args.library, "dss_connection_test.py")
+    templar = Templar(loader=DataLoader())
+    b_module_data = modify_module("dss_connection_test", module_path, module_args, templar, task_vars={})[0]
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".py") as payload:
+            payload.write(b_module_data)
+            payload.flush()
+            start = time.time()
+            output = subprocess.Popen([sys.executable, payload.name], stdout=subprocess.PIPE).communicate()[0]
+            duration = time.time() - start
+    finally:
+        server.shutdown()
+
+    module_result = json.loads(output.decode("UTF-8"))
+    print("Module ran in {:.2f}s, expected failures: {}".format(duration, ", ".join(sorted(DSSStandIn.failing))))
+    keys = ["msg", "failed", "failed_connections", "failure_rate", "latency"]
+    print(json.dumps(dict((key, module_result.get(key, None)) for key in keys), indent=2))
+
+
+if __name__ == "__main__":
+    main()
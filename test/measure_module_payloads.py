@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Measures, for every dss_* module of the library, the size of the AnsiballZ
+payload sent to the target and the time between the start of the interpreter
+and the first request received by DSS.
+
+The modules are built with the module_utils search path of Ansible, so it must
+contain both this role and the dataikuapi package:
+
+    ANSIBLE_MODULE_UTILS=module_utils:/path/to/roles/dataiku-api-client-python/module_utils \\
+        python test/measure_module_payloads.py --runs 5
+
+Requests are sent to a local HTTP server standing in for DSS, which only
+records the arrival of the first request. Run the script on two checkouts to
+compare a change with its baseline.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ansible.executor.module_common import modify_module
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+from six.moves import BaseHTTPServer
+
+try:
+    from ansible.plugins.loader import init_plugin_loader
+except ImportError:
+    # Ansible before 2.15 sets up the collection loader on import
+    init_plugin_loader = None
+
+# Minimal arguments for each module to pass validation and reach its first request
+MODULE_ARGS = {
+    "dss_user": {"login": "measure"},
+    "dss_users": {"users": []},
+    "dss_group": {"name": "measure"},
+    "dss_groups": {"groups": []},
+    "dss_connection_generic": {"name": "measure", "type": "Filesystem"},
+    "dss_connection_postgresql": {"name": "measure"},
+    "dss_connections": {"connections": []},
+    "dss_code_env": {"name": "measure", "lang": "PYTHON"},
+    "dss_plugin": {"plugin_id": "measure"},
+    "dss_general_settings": {},
+    "dss_api_deployer_infra": {"id": "measure", "stage": "measure", "type": "STATIC", "api_nodes": []},
+}
+
+
+class FirstRequestRecorder(BaseHTTPServer.BaseHTTPRequestHandler):
+    first_request_time = None
+
+    def _answer(self):
+        if FirstRequestRecorder.first_request_time is None:
+            FirstRequestRecorder.first_request_time = time.time()
+        body = json.dumps({"errorType": "measure", "message": "Measurement stand-in"}).encode("UTF-8")
+        self.send_response(500)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure_module(module_path, server, runs, templar):
+    module_name = os.path.splitext(os.path.basename(module_path))[0]
+    module_args = dict(MODULE_ARGS.get(module_name, {}))
+    module_args.update(
+        {"host": "127.0.0.1", "port": str(server.server_address[1]), "api_key": "measure", "_ansible_check_mode": True}
+    )
+    task_vars = {"ansible_python_interpreter": sys.executable}
+    b_module_data = modify_module(module_name, module_path, module_args, templar, task_vars=task_vars)[0]
+
+    timings = []
+    with tempfile.NamedTemporaryFile(suffix=".py") as payload:
+        payload.write(b_module_data)
+        payload.flush()
+        for _ in range(runs):
+            FirstRequestRecorder.first_request_time = None
+            start = time.time()
+            subprocess.call([sys.executable, payload.name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if FirstRequestRecorder.first_request_time is not None:
+                timings.append(FirstRequestRecorder.first_request_time - start)
+    timings.sort()
+    median = timings[len(timings) // 2] if timings else None
+    return module_name, len(b_module_data), median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", default=os.path.join(os.path.dirname(__file__), "..", "library"))
+    parser.add_argument("--modules", default=None, help="Comma separated list of modules, all by default")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    module_paths = sorted(glob.glob(os.path.join(args.library, "dss_*.py")))
+    if args.modules is not None:
+        selected = set(args.modules.split(","))
+        module_paths = [p for p in module_paths if os.path.splitext(os.path.basename(p))[0] in selected]
+
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), FirstRequestRecorder)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    if init_plugin_loader is not None:
+        init_plugin_loader()
+    templar = Templar(loader=DataLoader())
+    results = []
+    try:
+        for module_path in module_paths:
+            results.append(measure_module(module_path, server, args.runs, templar))
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(
+            json.dumps(
+                [{"module": name, "payload_bytes": size, "first_request_seconds": delay} for name, size, delay in results],
+                indent=2,
+            )
+        )
+        return
+    print("{:<28} {:>14} {:>22}".format("module", "payload (KiB)", "first request (ms)"))
+    for name, size, delay in results:
+        print(
+            "{:<28} {:>14.1f} {:>22}".format(
+                name, size / 1024.0, "{:.0f}".format(delay * 1000) if delay is not None else "no request"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()